@@ -0,0 +1,229 @@
+""" Micro-benchmarks of the Banks of bankcoin, txbankcoin, utxobankcoin and
+banknetcoin. Every scale issues a number of coins to a number of owners and
+spends half of them, then queries every owner. issue, handle_tx (observe_coin
+for bankcoin), fetch_utxo (fetch_coins for bankcoin) and fetch_balance (the
+number of coins for bankcoin) are timed per call. Signing happens outside of
+the timed sections.
+
+The results are written as JSON. Given a baseline written by an earlier run,
+every operation that became slower than the tolerance allows is reported
+and the script exits with status 1. Timings are compared relative to a fixed
+calibration workload measured in the same run, so a machine that is busier
+or slower than the one that wrote the baseline does not show up as a
+regression. Regenerate the baseline after intended changes in speed.
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/bank-benchmark.py
+           [--output results.json] [--baseline bank-benchmark-baseline.json]
+"""
+import sys
+import json
+import time
+import platform
+from uuid import uuid4
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain import bankcoin, txbankcoin, utxobankcoin, banknetcoin
+
+AMOUNT = 10
+# queries are repeated until they ran this long, a single round of a few
+# microseconds is mostly noise
+MIN_SECONDS = 0.05
+TX_MODULES = {
+    'txbankcoin': txbankcoin,
+    'utxobankcoin': utxobankcoin,
+    'banknetcoin': banknetcoin,
+}
+IMPLEMENTATIONS = ['bankcoin'] + list(TX_MODULES)
+
+
+def make_keys(owners):
+    keys = []
+    for number in range(owners):
+        private_key = SigningKey.from_secret_exponent(number + 1,
+                                                      curve=SECP256k1)
+        keys.append((private_key, private_key.get_verifying_key()))
+    return keys
+
+
+def timed(timings, operation, calls, repeatable=False):
+    """ Times a list of calls and records the seconds and number of calls.
+    Repeatable calls, i.e. queries, are run in rounds for MIN_SECONDS
+    """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for call in calls:
+            call()
+        count += len(calls)
+        seconds = time.perf_counter() - start
+        if not repeatable or seconds >= MIN_SECONDS:
+            break
+    timings[operation] = (seconds, count)
+
+
+def run_bankcoin(coins, transactions, keys):
+    bank = bankcoin.Bank()
+    timings = {}
+    issued = []
+    timed(timings, 'issue',
+          [lambda i=i: issued.append(bank.issue(keys[i % len(keys)][1]))
+           for i in range(coins)])
+
+    for j in range(transactions):
+        issued[j].transfer(keys[j % len(keys)][0],
+                           keys[(j + 1) % len(keys)][1])
+    timed(timings, 'handle_tx',
+          [lambda coin=coin: bank.observe_coin(coin)
+           for coin in issued[:transactions]])
+
+    timed(timings, 'fetch_utxo',
+          [lambda key=key: bank.fetch_coins(key) for _, key in keys], True)
+    timed(timings, 'fetch_balance',
+          [lambda key=key: len(bank.fetch_coins(key)) for _, key in keys],
+          True)
+    return timings
+
+
+def run_tx_bank(module, coins, transactions, keys):
+    bank = module.Bank()
+    timings = {}
+    issued = []
+    timed(timings, 'issue',
+          [lambda i=i: issued.append(bank.issue(AMOUNT, keys[i % len(keys)][1]))
+           for i in range(coins)])
+
+    txs = []
+    for j in range(transactions):
+        tx_id = uuid4()
+        tx_ins = [module.TxIn(tx_id=issued[j].id, index=0, signature=None)]
+        tx_outs = [module.TxOut(tx_id=tx_id, index=0, amount=AMOUNT,
+                                public_key=keys[(j + 1) % len(keys)][1])]
+        tx = module.Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+        tx.sign_input(0, keys[j % len(keys)][0])
+        txs.append(tx)
+    timed(timings, 'handle_tx', [lambda tx=tx: bank.handle_tx(tx)
+                                 for tx in txs])
+
+    timed(timings, 'fetch_utxo',
+          [lambda key=key: bank.fetch_utxo(key) for _, key in keys], True)
+    timed(timings, 'fetch_balance',
+          [lambda key=key: bank.fetch_balance(key) for _, key in keys], True)
+    return timings
+
+
+def calibrate(repeat):
+    """ Microseconds of a fixed workload of signature checks and dict
+    operations, the best of repeat runs
+    """
+    private_key = SigningKey.from_secret_exponent(1, curve=SECP256k1)
+    public_key = private_key.get_verifying_key()
+    signature = private_key.sign(b'calibration')
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(10):
+            public_key.verify(signature, b'calibration')
+        table = {}
+        for i in range(100000):
+            table[(i, i)] = i
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best * 1e6
+
+
+def run(implementation, coins, transactions, keys):
+    if implementation == 'bankcoin':
+        return run_bankcoin(coins, transactions, keys)
+    return run_tx_bank(TX_MODULES[implementation], coins, transactions, keys)
+
+
+def compare(results, calibration_us, baseline, tolerance):
+    """ The results that are slower per call than the baseline allows,
+    relative to the calibration workloads of both runs
+    """
+    reference = {(r['implementation'], r['coins'], r['operation']): r
+                 for r in baseline['results']}
+    # baselines written without calibration are compared as they are
+    scale = baseline.get('calibration_us', calibration_us) / calibration_us
+    regressions = []
+    for result in results:
+        old = reference.get((result['implementation'], result['coins'],
+                             result['operation']))
+        if old is None or not old['per_call_us']:
+            continue
+        ratio = result['per_call_us'] * scale / old['per_call_us']
+        if ratio > 1 + tolerance:
+            regressions.append(dict(result, baseline_us=old['per_call_us'],
+                                    ratio=ratio))
+    return regressions
+
+
+@click.command()
+@click.option('--scales', default='100,400', show_default=True,
+              help='Comma separated numbers of issued coins')
+@click.option('--owners', default=10, show_default=True,
+              help='Number of owners the coins are spread over')
+@click.option('--repeat', default=3, show_default=True,
+              help='Runs per scale, the fastest run is reported')
+@click.option('--implementations', default=','.join(IMPLEMENTATIONS),
+              show_default=True, help='Comma separated Banks to measure')
+@click.option('--output', type=click.File('w'), default='-',
+              help='File to write the JSON results to')
+@click.option('--baseline', type=click.File('r'), default=None,
+              help='Results of an earlier run to compare with')
+@click.option('--tolerance', default=0.25, show_default=True,
+              help='Allowed slowdown per call relative to the baseline')
+def main(scales, owners, repeat, implementations, output, baseline,
+         tolerance):
+    keys = make_keys(owners)
+    calibration_us = None
+    results = []
+    for implementation in implementations.split(','):
+        for coins in [int(scale) for scale in scales.split(',')]:
+            # the best calibration of the run, like the best of the timings
+            calibration = calibrate(repeat)
+            if calibration_us is None or calibration < calibration_us:
+                calibration_us = calibration
+            transactions = coins // 2
+            best = {}
+            for _ in range(repeat):
+                for operation, (seconds, calls) in \
+                        run(implementation, coins, transactions, keys).items():
+                    if operation not in best or seconds < best[operation][0]:
+                        best[operation] = (seconds, calls)
+            for operation, (seconds, calls) in best.items():
+                results.append({
+                    'implementation': implementation,
+                    'coins': coins,
+                    'transactions': transactions,
+                    'owners': owners,
+                    'operation': operation,
+                    'calls': calls,
+                    'seconds': seconds,
+                    'per_call_us': seconds / calls * 1e6 if calls else 0.0,
+                })
+            click.echo(f"{implementation} {coins} coins done", err=True)
+
+    report = {'python': platform.python_version(),
+              'calibration_us': calibration_us, 'results': results}
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, calibration_us, json.load(baseline),
+                              tolerance)
+        report['regressions'] = regressions
+    json.dump(report, output, indent=2)
+    output.write("\n")
+
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression['implementation']} "
+                   f"{regression['operation']} at {regression['coins']} "
+                   f"coins: {regression['per_call_us']:.1f} us per call, "
+                   f"baseline {regression['baseline_us']:.1f} us, "
+                   f"{regression['ratio']:.2f}x after calibration",
+                   err=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
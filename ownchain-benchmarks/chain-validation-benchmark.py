@@ -0,0 +1,43 @@
+""" Validation time of a long BankCoin transfer chain, one transfer after
+the other in this process and in chunks in worker processes. The speed-up
+is bounded by the number of CPU cores of the machine
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/chain-validation-benchmark.py
+"""
+import os
+import time
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain.bankcoin import Bank
+from ownchain.utils import get_pool
+
+
+@click.command()
+@click.option('--transfers', default=500, help='Transfers of the coin')
+@click.option('--workers', default='1,2,4', help='Comma separated pool sizes')
+def main(transfers, workers):
+    keys = []
+    for number in range(1, 3):
+        private_key = SigningKey.from_secret_exponent(number, curve=SECP256k1)
+        keys.append((private_key, private_key.get_verifying_key()))
+    coin = Bank().issue(keys[0][1])
+    for i in range(transfers):
+        coin.transfer(keys[i % 2][0], keys[(i + 1) % 2][1])
+
+    print(f"{os.cpu_count()} CPUs, {transfers} transfers")
+    for size in [None] + [int(w) for w in workers.split(',')]:
+        if size:
+            # start the worker processes outside of the measurement
+            list(get_pool(size).map(abs, range(size)))
+        # drop the checkpoint so every transfer is verified
+        coin._checkpoint = None
+        start = time.perf_counter()
+        coin.validate(workers=size)
+        elapsed = time.perf_counter() - start
+        name = 'sequential' if size is None else f'{size} workers'
+        print(f"{name:>12}: {elapsed:8.3f} s {transfers / elapsed:10.1f} "
+              f"transfers/s")
+
+
+if __name__ == "__main__":
+    main()
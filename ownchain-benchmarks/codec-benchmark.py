@@ -0,0 +1,73 @@
+""" Benchmark of the binary codec of ownchain.codec against pickle. Compares
+the size and the encode/decode throughput of a utxo response and of a
+transaction with many inputs
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/codec-benchmark.py [--size N]
+"""
+import time
+import uuid
+import pickle
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain import codec
+from ownchain.banknetcoin import Tx, TxIn, TxOut, prepare_message
+
+alice_private_key = SigningKey.from_secret_exponent(1, curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_public_key = SigningKey.from_secret_exponent(2, curve=SECP256k1) \
+    .get_verifying_key()
+
+
+def utxo_response(size):
+    """A utxo response with size outputs of alice
+    """
+    utxos = [TxOut(tx_id=uuid.uuid4(), index=0, amount=i,
+                   public_key=alice_public_key)
+             for i in range(size)]
+    return prepare_message("utxos", utxos)
+
+
+def tx_message(size):
+    """A tx message spending size inputs of alice
+    """
+    tx_id = uuid.uuid4()
+    tx_ins = [TxIn(tx_id=uuid.uuid4(), index=0, signature=None)
+              for _ in range(size)]
+    tx_outs = [TxOut(tx_id=tx_id, index=0, amount=size,
+                     public_key=bob_public_key)]
+    tx = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    for index in range(size):
+        tx.sign_input(index, alice_private_key)
+    return prepare_message("tx", tx)
+
+
+def measure(name, message, encode, decode, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encoded = encode(message)
+    encode_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(encoded)
+    decode_time = (time.perf_counter() - start) / repeat
+
+    print(f"{name:>16} {len(encoded):>10} {1 / encode_time:>12.1f} "
+          f"{1 / decode_time:>12.1f}")
+
+
+@click.command()
+@click.option('--size', default=1000, help='Number of UTXOs and inputs')
+@click.option('--repeat', default=10, help='Repetitions per measurement')
+def main(size, repeat):
+    print(f"{'message':>16} {'bytes':>10} {'encodes/s':>12} {'decodes/s':>12}")
+    for name, message in [("utxos", utxo_response(size)),
+                          ("tx", tx_message(size))]:
+        measure(f"{name} pickle", message, pickle.dumps, pickle.loads,
+                repeat)
+        measure(f"{name} codec", message, codec.encode, codec.decode,
+                repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+""" Comparison of the coin selection strategies of utils.select_utxos on
+synthetic wallets with thousands of small UTXOs. Reports the average number
+of inputs (each one a signature to create and verify), the average change
+and the time per selection
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/coin-selection-benchmark.py
+"""
+import time
+import uuid
+import random
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import TxOut
+from ownchain.utils import select_utxos, STRATEGIES
+
+public_key = SigningKey.from_secret_exponent(1, curve=SECP256k1) \
+    .get_verifying_key()
+
+
+def synthetic_wallet(rng, size, max_amount):
+    return [TxOut(tx_id=uuid.uuid4(), index=0,
+                  amount=rng.randint(1, max_amount), public_key=public_key)
+            for _ in range(size)]
+
+
+@click.command()
+@click.option('--wallets', default=20, help='Number of synthetic wallets')
+@click.option('--size', default=5000, help='UTXOs per wallet')
+@click.option('--max-amount', default=100, help='Largest UTXO amount')
+@click.option('--seed', default=0, help='Random seed')
+def main(wallets, size, max_amount, seed):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(wallets):
+        utxos = synthetic_wallet(rng, size, max_amount)
+        balance = sum(tx_out.amount for tx_out in utxos)
+        cases.append((utxos, rng.randint(1, balance // 10)))
+
+    print(f"{'strategy':>12} {'inputs':>10} {'change':>10} {'ms':>10}")
+    for strategy in STRATEGIES:
+        inputs = change = 0
+        start = time.perf_counter()
+        for utxos, amount in cases:
+            selection = select_utxos(utxos, amount, strategy)
+            inputs += len(selection.utxos)
+            change += selection.change
+        elapsed = (time.perf_counter() - start) / len(cases)
+        print(f"{strategy:>12} {inputs / len(cases):>10.1f} "
+              f"{change / len(cases):>10.1f} {elapsed * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
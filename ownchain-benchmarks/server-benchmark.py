@@ -0,0 +1,83 @@
+""" Throughput comparison of the legacy and the asyncio based banknetcoin
+servers under concurrent clients. Optionally a slow client trickles its
+request byte by byte, which stalls the legacy server for everybody
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/server-benchmark.py
+"""
+import time
+import socket
+import asyncio
+import threading
+import click
+from ownchain import banknetcoin
+from ownchain.banknetcoin import MyTCPServer, TCPHandler, FRAME_HEADER, \
+    exchange, prepare_message, start_async_server
+from ownchain.example_users import user_public_key
+from ownchain.utils import serialize
+
+
+def start_legacy():
+    server = MyTCPServer(('127.0.0.1', 0), TCPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address
+
+
+def start_async():
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_async_server(('127.0.0.1', 0)))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server.sockets[0].getsockname()
+
+
+def client(address, requests, public_key):
+    for _ in range(requests):
+        with socket.create_connection(address) as sock:
+            exchange(sock, 'balance', public_key)
+
+
+def slow_client(address, delay, stop):
+    payload = serialize(prepare_message('ping', ''))
+    frame = FRAME_HEADER.pack(len(payload)) + payload
+    while not stop.is_set():
+        with socket.create_connection(address) as sock:
+            for i in range(len(frame)):
+                sock.sendall(frame[i:i + 1])
+                time.sleep(delay)
+            sock.recv(1024)
+
+
+def run(address, clients, requests, slow_delay):
+    public_key = user_public_key('alice')
+    stop = threading.Event()
+    if slow_delay:
+        threading.Thread(target=slow_client, args=(address, slow_delay, stop),
+                         daemon=True).start()
+        time.sleep(0.1)
+
+    threads = [threading.Thread(target=client,
+                                args=(address, requests, public_key))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return clients * requests / elapsed
+
+
+@click.command()
+@click.option('--clients', default=8, help='Number of concurrent clients')
+@click.option('--requests', default=200, help='Requests per client')
+@click.option('--slow-delay', default=0.0,
+              help='Seconds between the bytes of an additional slow client')
+def main(clients, requests, slow_delay):
+    banknetcoin.BANK.issue(1000, user_public_key('alice'))
+    for mode, start in [('legacy', start_legacy), ('async', start_async)]:
+        throughput = run(start(), clients, requests, slow_delay)
+        print(f"{mode:>8}: {throughput:10.1f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+""" Comparison of the legacy transfer messages (a pickled dict with the
+VerifyingKey object) with the canonical format of
+utils.encode_transfer_message. Reports the message size, the time to build
+a message and the validate throughput of a BankCoin with many transfers
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/transfer-message-benchmark.py
+"""
+import time
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain.bankcoin import Bank, Transfer, create_transfer_message
+from ownchain.utils import MESSAGE_VERSION, LEGACY_MESSAGE_VERSION
+
+VERSIONS = [('legacy', LEGACY_MESSAGE_VERSION), ('canonical', MESSAGE_VERSION)]
+
+
+def signed_coin(keys, transfers, version):
+    coin = Bank().issue(keys[0][1])
+    coin.message_version = version
+    for i in range(transfers):
+        coin.transfer(keys[i % len(keys)][0], keys[(i + 1) % len(keys)][1])
+    return coin
+
+
+@click.command()
+@click.option('--transfers', default=200, help='Transfers of the coin')
+@click.option('--messages', default=20000, help='Messages to build')
+@click.option('--repeat', default=3, help='Validations per format')
+def main(transfers, messages, repeat):
+    keys = []
+    for number in range(1, 3):
+        private_key = SigningKey.from_secret_exponent(number, curve=SECP256k1)
+        keys.append((private_key, private_key.get_verifying_key()))
+    signature = keys[0][0].sign(b'previous')
+    transfer = Transfer(signature=signature, public_key=keys[1][1])
+
+    print(f"{'format':>10} {'bytes':>6} {'build us':>9} {'validate/s':>11}")
+    for name, version in VERSIONS:
+        size = len(create_transfer_message(signature, transfer.public_key,
+                                           version))
+        public_key = transfer.public_key if version == \
+            LEGACY_MESSAGE_VERSION else transfer.public_key_bytes
+        start = time.perf_counter()
+        for _ in range(messages):
+            create_transfer_message(signature, public_key, version)
+        build = (time.perf_counter() - start) / messages
+
+        coin = signed_coin(keys, transfers, version)
+        best = None
+        for _ in range(repeat):
+            # drop the checkpoint so every transfer is verified
+            coin._checkpoint = None
+            start = time.perf_counter()
+            coin.validate()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>10} {size:>6} {build * 1e6:>9.1f} "
+              f"{transfers / best:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+""" Memory per UTXO of the default dict and of the compact array-backed
+store of ownchain.utxostore, alone and inside a banknetcoin.Bank whose owner
+index and balances hold further data per UTXO. Every output gets its own
+VerifyingKey object, as after deserializing transactions from the network
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/utxo-memory-benchmark.py
+"""
+import gc
+import uuid
+import tracemalloc
+import click
+from ecdsa import SigningKey, VerifyingKey, SECP256k1
+from ownchain.banknetcoin import Bank, TxOut
+from ownchain.utxostore import CompactUTXO
+
+
+def tx_outs(size, raw_keys):
+    for i in range(size):
+        public_key = VerifyingKey.from_string(raw_keys[i % len(raw_keys)],
+                                              curve=SECP256k1)
+        yield TxOut(tx_id=uuid.uuid4(), index=i % 2, amount=i,
+                    public_key=public_key)
+
+
+def fill_store(utxo):
+    def fill(size, raw_keys):
+        for tx_out in tx_outs(size, raw_keys):
+            utxo[tx_out.outpoint] = tx_out
+    return fill
+
+
+def fill_bank(bank):
+    def fill(size, raw_keys):
+        bank.load_utxo(tx_outs(size, raw_keys))
+    return fill
+
+
+def measure(name, fill, size, raw_keys):
+    gc.collect()
+    tracemalloc.start()
+    fill(size, raw_keys)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>12}: {current / 2**20:10.1f} MiB "
+          f"{current / size:8.1f} bytes per UTXO")
+
+
+@click.command()
+@click.option('--size', default=1000000, help='Number of UTXOs')
+@click.option('--owners', default=1000, help='Number of distinct owners')
+def main(size, owners):
+    raw_keys = [SigningKey.from_secret_exponent(i + 1, curve=SECP256k1)
+                .get_verifying_key().to_string() for i in range(owners)]
+    measure("dict", fill_store({}), size, raw_keys)
+    measure("compact", fill_store(CompactUTXO(TxOut)), size, raw_keys)
+    measure("bank dict", fill_bank(Bank()), size, raw_keys)
+    measure("bank compact", fill_bank(Bank(utxo=CompactUTXO(TxOut))), size,
+            raw_keys)
+
+
+if __name__ == "__main__":
+    main()
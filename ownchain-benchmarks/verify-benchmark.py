@@ -0,0 +1,63 @@
+""" Benchmark of the process pool signature verification in
+banknetcoin.Bank.validate against the number of transaction inputs
+
+Usage: PYTHONPATH=. python ownchain-benchmarks/verify-benchmark.py [--workers N] [--repeat N]
+"""
+import time
+import uuid
+import click
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import Bank, Tx, TxIn, TxOut, SIGNATURE_CACHE
+
+alice_private_key = SigningKey.from_secret_exponent(1, curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_public_key = SigningKey.from_secret_exponent(2, curve=SECP256k1) \
+    .get_verifying_key()
+
+
+def build_tx(bank, num_inputs):
+    """Issues num_inputs coins to alice and spends all of them in one Tx
+    """
+    coinbases = [bank.issue(1, alice_public_key) for _ in range(num_inputs)]
+    tx_id = uuid.uuid4()
+    tx_ins = [TxIn(tx_id=coinbase.id, index=0, signature=None)
+              for coinbase in coinbases]
+    tx_outs = [TxOut(tx_id=tx_id, index=0, amount=num_inputs,
+                     public_key=bob_public_key)]
+    tx = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    for index in range(num_inputs):
+        tx.sign_input(index, alice_private_key)
+    return tx
+
+
+def time_validate(bank, tx, workers, repeat):
+    bank.workers = workers
+    elapsed = 0.0
+    for _ in range(repeat):
+        # verify every signature instead of looking up the earlier runs
+        SIGNATURE_CACHE.clear()
+        start = time.perf_counter()
+        bank.validate(tx)
+        elapsed += time.perf_counter() - start
+    return elapsed / repeat
+
+
+@click.command()
+@click.option('--workers', default=4, help='Size of the process pool')
+@click.option('--repeat', default=3, help='Repetitions per measurement')
+def main(workers, repeat):
+    bank = Bank()
+
+    # warm up the pool so worker start-up is not measured
+    time_validate(bank, build_tx(bank, workers), workers, 1)
+
+    print(f"{'inputs':>8} {'sequential':>12} {'parallel':>12} {'speedup':>8}")
+    for num_inputs in [1, 2, 4, 8, 16, 32, 64, 128]:
+        tx = build_tx(bank, num_inputs)
+        seq = time_validate(bank, tx, None, repeat)
+        par = time_validate(bank, tx, workers, repeat)
+        print(f"{num_inputs:>8} {seq:>11.4f}s {par:>11.4f}s {seq / par:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,34 +17,47 @@ Contains the following functions:
     * create_transfer_message
 ...
 """
-from ownchain.utils import serialize
+from ownchain.utils import serialize, transfers_digest, \
+    encode_transfer_message, first_invalid_signature, MESSAGE_VERSION, \
+    LEGACY_MESSAGE_VERSION
 from ecdsa import BadSignatureError, SigningKey, SECP256k1
 
 #####################
 # Hellper functions #
 #####################
 
-def create_transfer_message(previous_signature, public_key):
+def create_transfer_message(previous_signature, public_key,
+                            version=MESSAGE_VERSION):
     """A function to create a transfer message for the next transfer
 
     Parameters
     ----------
     previous_signature : bytecode
         The signature of the previous transfer
-    public_key: ecdsa.keys.VerifyingKey
-        the public key of the recipient
+    public_key: ecdsa.keys.VerifyingKey or bytes
+        the public key of the recipient. Its raw bytes are accepted by
+        MESSAGE_VERSION only
+    version: int
+        MESSAGE_VERSION for the canonical format of
+        utils.encode_transfer_message or LEGACY_MESSAGE_VERSION for coins
+        signed before it
 
     Returns
     -------
     bytecode
         A signed message
     """
-    message = {
-        "previous_signature": previous_signature,
-        "next_public_key": public_key
-    }
-        
-    return serialize(message)
+    if version == LEGACY_MESSAGE_VERSION:
+        message = {
+            "previous_signature": previous_signature,
+            "next_public_key": public_key
+        }
+        return serialize(message)
+
+    assert version == MESSAGE_VERSION, f"unknown message version {version}"
+    if not isinstance(public_key, bytes):
+        public_key = public_key.to_string()
+    return encode_transfer_message(previous_signature, public_key)
 
 #############
 # ECDSACoin #
@@ -59,6 +72,8 @@ class Transfer:
         cryptographic signature of the sender
     public_key: ecdsa.keys.VerifyingKey
         the public key of the recipient
+    public_key_bytes: bytes
+        the raw bytes of public_key
 
     Methods
     -------
@@ -68,6 +83,21 @@ class Transfer:
         self.signature = signature
         self.public_key = public_key
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_public_key_bytes', None)
+        return state
+
+    @property
+    def public_key_bytes(self):
+        """The raw bytes of public_key, cached until it is replaced
+        """
+        cached = self.__dict__.get('_public_key_bytes')
+        if cached is None or cached[0] is not self.public_key:
+            cached = (self.public_key, self.public_key.to_string())
+            self._public_key_bytes = cached
+        return cached[1]
+
 class ECDSACoin:
     """The class of the ECDSACoin
     
@@ -75,13 +105,39 @@ class ECDSACoin:
     ----------
     transfers: list
         A list of coin transfers where each element is of type Transfer
+    message_version: int
+        The format of the signed transfer messages, MESSAGE_VERSION by
+        default. Set it to LEGACY_MESSAGE_VERSION on a coin or the class to
+        validate coins signed before the canonical format
+
+    The coin remembers how many of its transfers have been verified and a
+    digest of them, so validate only verifies new transfers. The checkpoint
+    is not pickled, a received coin is always verified completely
 
     Methods
     -------
     None
     """
+    message_version = MESSAGE_VERSION
+
     def __init__(self, transfers):
         self.transfers = transfers
+        # (number of verified transfers, transfers_digest of them)
+        self._checkpoint = None
+
+    def __getstate__(self):
+        # the checkpoint is only trusted by the process that verified it
+        state = self.__dict__.copy()
+        state.pop('_checkpoint', None)
+        return state
+
+    def _transfer_message(self, previous_signature, transfer):
+        # the cached key bytes suffice unless the legacy format is used
+        public_key = transfer.public_key
+        if self.message_version != LEGACY_MESSAGE_VERSION:
+            public_key = transfer.public_key_bytes
+        return create_transfer_message(previous_signature, public_key,
+                                       self.message_version)
 
     def is_owner(self, public_key):
         """Checks the ownership of the coin if given a public key to compare
@@ -99,7 +155,7 @@ class ECDSACoin:
             return True
         return False
 
-    def validate(self, bank):
+    def validate(self, bank, workers=None):
         """A function to validate the coin transfers. It is split in
         verifying that the first transaction came indeed from a bank and the 
         next transaction are all valid.
@@ -109,32 +165,65 @@ class ECDSACoin:
         bank: Bank
             The bank that has issued the first coin. Needed in order to be
             able to check the coinage transaction is valid
+        workers: int or None
+            The number of worker processes verifying chunks of the chain in
+            parallel. None verifies the transfers one at a time in this
+            process
 
         Returns
         -------
         bool
         """
-        
-        try:
-            first_transfer = self.transfers[0]
-            message = create_transfer_message(b'',first_transfer.public_key)
-            bank.public_key.verify(first_transfer.signature, message)
-            
-        except BadSignatureError:
-            print("Bad Signature in coinage transaction")
-            return False
-
-        try:
-            for i in range(len(self.transfers))[1:]:
-                message = create_transfer_message(self.transfers[i-1].signature,
-                           self.transfers[i].public_key)
-                self.transfers[i-1].public_key.verify(self.transfers[i].signature,
-                                                      message)
-                
-        except BadSignatureError:
-            print("Bad Signature in transaction number", i+1)
-            return False
+        # a checkpoint is only valid for the bank it was verified with
+        digest = bank.public_key.to_string()
+        start = 1
+        checkpoint = getattr(self, '_checkpoint', None)
+        if checkpoint is not None:
+            count, checkpoint_digest = checkpoint
+            if count <= len(self.transfers) and checkpoint_digest == \
+               transfers_digest(self.transfers[:count], digest):
+                start, digest = count, checkpoint_digest
+            else:
+                # the verified transfers have been changed
+                self._checkpoint = None
+
+        if start == 1:
+            try:
+                first_transfer = self.transfers[0]
+                message = self._transfer_message(b'', first_transfer)
+                bank.public_key.verify(first_transfer.signature, message)
+
+            except BadSignatureError:
+                print("Bad Signature in coinage transaction")
+                return False
+            digest = transfers_digest(self.transfers[:1], digest)
+
+        if workers:
+            # every transfer is verified with the key of the one before
+            jobs = [(self.transfers[i-1].public_key_bytes,
+                     self.transfers[i].signature,
+                     self._transfer_message(self.transfers[i-1].signature,
+                                            self.transfers[i]))
+                    for i in range(len(self.transfers))[start:]]
+            invalid = first_invalid_signature(jobs, workers)
+            if invalid is not None:
+                print("Bad Signature in transaction number",
+                      start + invalid + 1)
+                return False
+        else:
+            try:
+                for i in range(len(self.transfers))[start:]:
+                    message = self._transfer_message(
+                        self.transfers[i-1].signature, self.transfers[i])
+                    self.transfers[i-1].public_key.verify(
+                        self.transfers[i].signature, message)
+
+            except BadSignatureError:
+                print("Bad Signature in transaction number", i+1)
+                return False
 
+        self._checkpoint = (len(self.transfers),
+                            transfers_digest(self.transfers[start:], digest))
         return True
 
 class User:
@@ -18,34 +18,47 @@ Contains the following functions:
 """
 from uuid import uuid4
 from copy import deepcopy
-from ownchain.utils import serialize
+from ownchain.utils import serialize, transfers_digest, \
+    encode_transfer_message, first_invalid_signature, MESSAGE_VERSION, \
+    LEGACY_MESSAGE_VERSION
 from ecdsa import BadSignatureError, SigningKey, SECP256k1
 
 #####################
 # Hellper functions #
 #####################
 
-def create_transfer_message(previous_signature, public_key):
+def create_transfer_message(previous_signature, public_key,
+                            version=MESSAGE_VERSION):
     """A function to create a transfer message for the next transfer
 
     Parameters
     ----------
     previous_signature : bytecode
         The signature of the previous transfer
-    public_key: ecdsa.keys.VerifyingKey
-        the public key of the recipient
+    public_key: ecdsa.keys.VerifyingKey or bytes
+        the public key of the recipient. Its raw bytes are accepted by
+        MESSAGE_VERSION only
+    version: int
+        MESSAGE_VERSION for the canonical format of
+        utils.encode_transfer_message or LEGACY_MESSAGE_VERSION for coins
+        signed before it
 
     Returns
     -------
     bytecode
         A signed message
     """
-    message = {
-        "previous_signature": previous_signature,
-        "next_public_key": public_key
-    }
-        
-    return serialize(message)
+    if version == LEGACY_MESSAGE_VERSION:
+        message = {
+            "previous_signature": previous_signature,
+            "next_public_key": public_key
+        }
+        return serialize(message)
+
+    assert version == MESSAGE_VERSION, f"unknown message version {version}"
+    if not isinstance(public_key, bytes):
+        public_key = public_key.to_string()
+    return encode_transfer_message(previous_signature, public_key)
 
 ############
 # BankCoin #
@@ -60,6 +73,8 @@ class Transfer:
         cryptographic signature of the sender
     public_key: ecdsa.keys.VerifyingKey
         the public key of the recipient
+    public_key_bytes: bytes
+        the raw bytes of public_key
 
     Methods
     -------
@@ -69,9 +84,24 @@ class Transfer:
         self.signature = signature
         self.public_key = public_key
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_public_key_bytes', None)
+        return state
+
+    @property
+    def public_key_bytes(self):
+        """The raw bytes of public_key, cached until it is replaced
+        """
+        cached = self.__dict__.get('_public_key_bytes')
+        if cached is None or cached[0] is not self.public_key:
+            cached = (self.public_key, self.public_key.to_string())
+            self._public_key_bytes = cached
+        return cached[1]
+
     def __eq__(self, other):
         return self.signature == other.signature and \
-            self.public_key.to_string() == other.public_key.to_string()
+            self.public_key_bytes == other.public_key_bytes
 
 class BankCoin:
     """The class of the BankCoin
@@ -82,22 +112,48 @@ class BankCoin:
         A list of coin transfers where each element is of type Transfer
     id: uuid.UUID
         The ID of the coin
+    message_version: int
+        The format of the signed transfer messages, MESSAGE_VERSION by
+        default. Set it to LEGACY_MESSAGE_VERSION on a coin or the class to
+        validate coins signed before the canonical format
+
+    The coin remembers how many of its transfers have been verified and a
+    digest of them, so validate only verifies new transfers. The checkpoint
+    is not pickled, a received coin is always verified completely
 
     Methods
     -------
     transfer
         creates a signed transfer to a recipient
     validate
-        validates all transfers of the coin and throws a BadSignatureError in
+        validates the transfers of the coin and throws a BadSignatureError in
         case it's invalid
     """
+    message_version = MESSAGE_VERSION
+
     def __init__(self, transfers):
         self.id = uuid4()
         self.transfers = transfers
+        # (number of verified transfers, transfers_digest of them)
+        self._checkpoint = None
 
     def __eq__(self, other):
         return self.id == other.id and self.transfers == other.transfers
 
+    def __getstate__(self):
+        # the checkpoint is only trusted by the process that verified it
+        state = self.__dict__.copy()
+        state.pop('_checkpoint', None)
+        return state
+
+    def _transfer_message(self, previous_signature, transfer):
+        # the cached key bytes suffice unless the legacy format is used
+        public_key = transfer.public_key
+        if self.message_version != LEGACY_MESSAGE_VERSION:
+            public_key = transfer.public_key_bytes
+        return create_transfer_message(previous_signature, public_key,
+                                       self.message_version)
+
     def transfer(self, owner_private_key, recipient_public_key):
         """Creates a signed transfer to a recepient
         
@@ -112,7 +168,9 @@ class BankCoin:
         -------
         """
         previous_signature = self.transfers[-1].signature
-        message = create_transfer_message(previous_signature, recipient_public_key)
+        message = create_transfer_message(previous_signature,
+                                          recipient_public_key,
+                                          self.message_version)
 
         transfer = Transfer(
             signature=owner_private_key.sign(message),
@@ -120,25 +178,72 @@ class BankCoin:
 
         self.transfers.append(transfer)
 
-    def validate(self):
+    def validate(self, start=1, workers=None, use_checkpoint=True):
         """A function to validate the coin transfers. It is split in
         verifying that the first transaction came indeed from a bank and the 
         next transaction are all valid.
 
         Parameters
         ----------
+        start: int
+            The index of the first transfer to verify. The transfers before
+            it are trusted, e.g. because they have been verified already.
+            Transfers covered by an unchanged checkpoint are skipped as well
+        workers: int or None
+            The number of worker processes verifying chunks of the chain in
+            parallel. None verifies the transfers one at a time in this
+            process
+        use_checkpoint: bool
+            Whether transfers covered by the checkpoint of the coin are
+            skipped. The checkpoint is not signed, so a coin handed over by
+            somebody else has to be verified with False
 
         Returns
         -------
         Throws BadSignatureError on error
         """        
-        previous_transfer = self.transfers[0]
-        for t in self.transfers[1:]:
-            message = create_transfer_message(
-                previous_signature=previous_transfer.signature,
-                public_key=t.public_key)
-            assert previous_transfer.public_key.verify(t.signature, message)
-            previous_transfer = t
+        digest = None
+        checkpoint = None
+        if use_checkpoint:
+            checkpoint = getattr(self, '_checkpoint', None)
+        if checkpoint is not None:
+            count, checkpoint_digest = checkpoint
+            if count <= len(self.transfers) and \
+               transfers_digest(self.transfers[:count]) == checkpoint_digest:
+                if count >= start:
+                    start, digest = count, checkpoint_digest
+            else:
+                # the verified transfers have been changed
+                self._checkpoint = None
+        if digest is None and start == 1:
+            digest = transfers_digest(self.transfers[:1])
+
+        if workers:
+            # every transfer is verified with the key of the one before
+            jobs = [(self.transfers[i - 1].public_key_bytes,
+                     self.transfers[i].signature,
+                     self._transfer_message(self.transfers[i - 1].signature,
+                                            self.transfers[i]))
+                    for i in range(start, len(self.transfers))]
+            invalid = first_invalid_signature(jobs, workers)
+            if invalid is not None:
+                raise BadSignatureError(
+                    f"Bad signature in transfer number {start + invalid}")
+        else:
+            previous_transfer = self.transfers[start - 1]
+            for i in range(start, len(self.transfers)):
+                t = self.transfers[i]
+                message = self._transfer_message(previous_transfer.signature,
+                                                 t)
+                assert previous_transfer.public_key.verify(t.signature,
+                                                           message)
+                previous_transfer = t
+
+        # only a chain verified from the start or from a checkpoint counts
+        if digest is not None:
+            self._checkpoint = (len(self.transfers),
+                                transfers_digest(self.transfers[start:],
+                                                 digest))
                 
 
 
@@ -150,6 +255,12 @@ class Bank:
     ----------
     coins: dict
         The database of coins as a key-value storage (ID to coin)
+    owners: dict
+        An index of the IDs of the coins associated with the raw bytes of
+        the public key of their current owner
+    workers: int or None
+        The number of worker processes used to verify the new transfers of
+        an observed coin. None verifies them one at a time in this process
 
     Methods
     -------
@@ -161,9 +272,13 @@ class Bank:
         read which coins belong to certain owner
     """
                                                    
-    def __init__(self):
+    def __init__(self, workers=None):
         # coin.id --> coin
         self.coins = {}        
+        # public_key.to_string() --> {coin.id: None}
+        # a dict is used as an insertion ordered set
+        self.owners = {}
+        self.workers = workers
 
     def issue(self, public_key):
         """Issues a new BankCoin to given public_key and record in database
@@ -186,6 +301,7 @@ class Bank:
 
         # Put coin into database
         self.coins[coin.id]=deepcopy(coin)
+        self.owners.setdefault(public_key.to_string(), {})[coin.id] = None
         
         return coin
 
@@ -207,11 +323,34 @@ class Bank:
         # might have been more transfers added but not recorded that would need
         # to be validated first
         num_transfers = len(current_coin_status.transfers)
-        assert current_coin_status.transfers == coin.transfers[:num_transfers]
-
-        coin.validate()
 
-        self.coins[coin.id] = deepcopy(coin)
+        # The recorded transfers have been verified before and are kept, so
+        # the coin only has to continue from the last recorded transfer
+        assert len(coin.transfers) >= num_transfers
+        assert current_coin_status.transfers[-1] == \
+            coin.transfers[num_transfers - 1]
+
+        # the checkpoint of the submitted coin could be forged, the record
+        # of the bank is the only trusted prefix
+        coin.validate(start=num_transfers, workers=self.workers,
+                      use_checkpoint=False)
+
+        # Record copies of the new transfers only, signatures and keys are
+        # immutable and can be shared
+        previous_owner = current_coin_status.transfers[-1].public_key
+        current_coin_status.transfers.extend(
+            Transfer(signature=t.signature, public_key=t.public_key)
+            for t in coin.transfers[num_transfers:])
+
+        # Move the coin to its new owner in the index
+        previous_owner = previous_owner.to_string()
+        owner = current_coin_status.transfers[-1].public_key.to_string()
+        if owner != previous_owner:
+            coins = self.owners[previous_owner]
+            del coins[coin.id]
+            if not coins:
+                del self.owners[previous_owner]
+            self.owners.setdefault(owner, {})[coin.id] = None
 
     def fetch_coins(self, public_key):
         """Read which coins belong to certain owner
@@ -226,9 +365,5 @@ class Bank:
         list
             A list of BankCoins of which the public_key holder is the owner
         """
-        coins = []
-        for coin in self.coins.values():
-            if coin.transfers[-1].public_key.to_string() == \
-               public_key.to_string():
-                coins.append(coin)
-        return coins
+        coin_ids = self.owners.get(public_key.to_string(), {})
+        return [self.coins[coin_id] for coin_id in coin_ids]
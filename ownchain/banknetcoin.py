@@ -11,37 +11,113 @@ original series the BankNetCoin is part of BlockCoin
 For teaching purposes only.
 
 Contains the following constants:
+    * SIGNATURE_CACHE
     * HOST
     * PORT
     * ADDRESS
+    * MAX_FRAME_SIZE
+    * KEEPALIVE_TIMEOUT
+    * WRITE_COMMANDS
+    * UTXO_PAGE_SIZE
     * BANK
+    * MEMPOOL
 
 Contains the following classes:
     * Bank
     * Tx
     * TxIn
     * TxOut
+    * Client
     * MyTCPServer
     * TCPHandler
 
 Contains the following functions:
+    * encode_outpoint
+    * encode_tx_out
     * spend_message
     * Arg parsing functions
     * prepare_message
+    * send_frame
+    * recv_exactly
+    * recv_frame
+    * read_frame
+    * write_frame
+    * exchange
+    * get_client
     * send_message
+    * handle_message
+    * handle_message_async
+    * commit_mempool
+    * handle_connection
+    * start_async_server
+    * serve_async
     * serve
 """
+import asyncio
 import socketserver
 import socket
+import threading
+import hashlib
+import struct
+import bisect
+import json
+from collections import ChainMap
 import click
 from uuid import uuid4
-from ownchain.utils import serialize, deserialize, prepare_tx
+from ecdsa import BadSignatureError
+from ownchain.utils import serialize, deserialize, prepare_tx, \
+    select_utxos, new_outputs, verify_signatures, SignatureCache, STRATEGIES
 from ownchain.example_users import user_private_key, user_public_key
+from ownchain.journal import Journal
+from ownchain.mempool import Mempool
+from ownchain.snapshot import Snapshot, SnapshotUTXO
+
+
+# Constants
+SIGNATURE_CACHE = SignatureCache(maxsize=100000)
 
 
 # Functions
-def spend_message(tx, index):
-    """ Creates a message to be signed in order to spend the outputs
+def encode_outpoint(outpoint):
+    """ Canonical encoding of an outpoint: the 16 bytes of the transaction ID
+    followed by the index as unsigned 32 bit big-endian integer
+
+    Parameters
+    ----------
+    outpoint: tuple
+        A tuple of transaction ID and index
+
+    Returns
+    -------
+    bytes
+    """
+    tx_id, index = outpoint
+    return tx_id.bytes + struct.pack(">I", index)
+
+
+def encode_tx_out(tx_out):
+    """ Canonical encoding of a transaction output: the outpoint, the amount
+    as unsigned 64 bit big-endian integer and the length-prefixed raw public
+    key of the recipient
+
+    Parameters
+    ----------
+    tx_out: TxOut
+        A transaction output
+
+    Returns
+    -------
+    bytes
+    """
+    public_key = tx_out.public_key.to_string()
+    return encode_outpoint(tx_out.outpoint) + \
+        struct.pack(">QB", tx_out.amount, len(public_key)) + public_key
+
+
+def spend_message(tx, index, outputs_digest=None):
+    """ Creates a message to be signed in order to spend the outputs. The
+    message is the SHA-256 digest of the digest of all outputs (see
+    Tx.outputs_digest) and the outpoint of the input
 
     Parameters
     ----------
@@ -49,14 +125,21 @@ def spend_message(tx, index):
         The newly constructed transaction
     index: int
         The index of the transaction input to be signed
+    outputs_digest: bytes or None
+        The digest of the outputs of tx. Pass it when signing or verifying
+        all inputs, so the outputs are encoded once per transaction. None
+        computes it
 
     Returns
     -------
-    A serialized message
+    bytes
+        A 32 byte message
     """
+    if outputs_digest is None:
+        outputs_digest = tx.outputs_digest
     tx_in = tx.tx_ins[index]
-    outpoint = tx_in.outpoint
-    return serialize(outpoint) + serialize(tx.tx_outs)
+    return hashlib.sha256(outputs_digest +
+                          encode_outpoint(tx_in.outpoint)).digest()
 
 
 # Classes
@@ -74,6 +157,8 @@ class Tx:
 
     Methods
     -------
+    outputs_digest
+        The SHA-256 digest of all transaction outputs
     sign_input
         method to sign the input in a transaction (usually by the sender)
     verify_input
@@ -85,7 +170,27 @@ class Tx:
         self.tx_ins = tx_ins
         self.tx_outs = tx_outs
 
-    def sign_input(self, index, private_key):
+    @property
+    def outputs_digest(self):
+        """ The SHA-256 digest of the canonical encoding of all transaction
+        outputs. It is computed on every access, so compute it once before
+        signing or verifying several inputs
+
+        Parameters
+        ----------
+        none
+
+        Returns
+        -------
+        bytes
+            A 32 byte digest
+        """
+        digest = hashlib.sha256()
+        for tx_out in self.tx_outs:
+            digest.update(encode_tx_out(tx_out))
+        return digest.digest()
+
+    def sign_input(self, index, private_key, outputs_digest=None):
         """ Method to sign the input in a transaction (usually by the sender)
 
         Parameters
@@ -95,16 +200,18 @@ class Tx:
             separately
         private_key: ecdsa.keys.SigningKey
             The private key of the owner of the input
+        outputs_digest: bytes or None
+            The digest of the outputs, see spend_message
 
         Returns
         -------
         none
         """
-        message = spend_message(self, index)
+        message = spend_message(self, index, outputs_digest)
         signature = private_key.sign(message)
         self.tx_ins[index].signature = signature
 
-    def verify_input(self, index, public_key):
+    def verify_input(self, index, public_key, outputs_digest=None):
         """ Verifying the validity of the signed input tx. Needed to verify
         that the sender is really allowed to spend this transaction
 
@@ -114,14 +221,25 @@ class Tx:
             The index of the TxIn
         public_key: ecdsa.keys.VerifyingKey
             The public_key of the sender
+        outputs_digest: bytes or None
+            The digest of the outputs, see spend_message
 
         Returns
         -------
-        None if valid, throws BadSignatureError otherwise
+        True if valid, throws BadSignatureError otherwise
         """
         tx_in = self.tx_ins[index]
-        message = spend_message(self, index)
-        return public_key.verify(tx_in.signature, message)
+        message = spend_message(self, index, outputs_digest)
+
+        # signatures that were verified before are looked up in the cache
+        key = SIGNATURE_CACHE.key(public_key.to_string(), tx_in.signature,
+                                  message)
+        if key in SIGNATURE_CACHE:
+            return True
+
+        valid = public_key.verify(tx_in.signature, message)
+        SIGNATURE_CACHE.add(key)
+        return valid
 
 
 class TxIn:
@@ -212,27 +330,76 @@ class Bank:
     Attributes
     ----------
     utxo: dict
-        A database of unspent transactions associated with an ID and index
+        A database of unspent transactions associated with an ID and index.
+        An empty ownchain.utxostore.CompactUTXO may be passed instead of
+        the default dict to save memory
+    owners: dict
+        An index of the outpoints in utxo associated with the raw bytes of
+        the public key of their owner. Every outpoint carries an increasing
+        sequence number that serves as cursor of paginated queries
+    balances: dict
+        The running balance associated with the raw bytes of a public key
+    workers: int or None
+        The number of worker processes used to verify the signatures of
+        a transaction. None verifies them one at a time in this process
+    journal: ownchain.journal.Journal or None
+        If set, every update of the UTXO database is recorded in it
+    snapshot: ownchain.snapshot.Snapshot or None
+        The memory-mapped snapshot the bank was started from. Owners are
+        loaded from it into owners and balances on first use
 
     Methods
     -------
     update_utxo
         Updates the UTXO database
+    load_utxo
+        Adds outputs to the UTXO database without recording a transaction
+    load_snapshot
+        Starts an empty bank from a memory-mapped snapshot
+    owner_outpoints
+        Get the outpoints of all UTXOs associated with raw public key bytes
     issue
         A method to issue new coins
     validate
         Method to validate a transactions
     handle_tx
         Method to deal with incoming transactions
+    validate_txs
+        Method to validate an ordered batch of transactions
+    handle_txs
+        Method to deal with an ordered batch of incoming transactions
     fetch_utxo
         Get all unspent transactions (UTXOs) that are associated with a
         specific public_key
+    fetch_utxo_page
+        Get a page of the UTXOs of a public_key following a cursor
+    fetch_utxo_covering
+        Get UTXOs of a public_key that cover at least an amount
     fetch_balance
         Get the balance for a specific public_key
+    check_balances
+        Recomputes all balances from the UTXO database and compares them
+        with the running balances
     """
-    def __init__(self):
+    def __init__(self, workers=None, utxo=None):
         # mapping (tx_id, index) --> tx_out
-        self.utxo = {}
+        self.utxo = {} if utxo is None else utxo
+        self.workers = workers
+        # mapping public_key.to_string() --> {(tx_id, index): sequence}
+        # insertion ordered, so the sequence numbers increase
+        self.owners = {}
+        self._sequence = 0
+        # mapping public_key.to_string() --> (sequences, outpoints), the
+        # owner index as two lists to seek a page cursor by bisection.
+        # Built on the first page query, spent entries are left in place
+        # until the lists are dropped
+        self._pages = {}
+        # mapping public_key.to_string() --> balance
+        self.balances = {}
+        self.journal = None
+        self.snapshot = None
+        # raw public keys whose snapshot entries have been loaded
+        self._loaded_owners = set()
 
     def update_utxo(self, tx):
         """ Updates the UTXO database with new transaction outputs while
@@ -246,12 +413,113 @@ class Bank:
         Returns
         -------
         none
+            Raises KeyError if an input is not unspent, e.g. because the
+            transaction spends it twice, and AssertionError if an output is
+            not new, see utils.new_outputs. The database is not changed then
         """
+        # check everything up front, a partial update would leave the
+        # database out of sync with the journal
+        outpoints = {tx_in.outpoint for tx_in in tx.tx_ins}
         for tx_in in tx.tx_ins:
-            del self.utxo[tx_in.outpoint]
+            if tx_in.outpoint not in self.utxo:
+                raise KeyError(tx_in.outpoint)
+        if len(outpoints) != len(tx.tx_ins):
+            raise KeyError("an input is spent twice")
+        assert new_outputs(tx, self.utxo)
 
-        for tx_out in tx.tx_outs:
+        for tx_in in tx.tx_ins:
+            tx_out = self.utxo.pop(tx_in.outpoint)
+            owner = tx_out.public_key.to_string()
+            outpoints = self.owner_outpoints(owner)
+            del outpoints[tx_in.outpoint]
+            self.balances[owner] -= tx_out.amount
+            if not outpoints:
+                del self.owners[owner]
+                del self.balances[owner]
+                self._pages.pop(owner, None)
+            elif owner in self._pages and \
+                    len(self._pages[owner][0]) > 2 * len(outpoints) + 16:
+                # mostly spent entries, rebuilt on the next page query
+                del self._pages[owner]
+
+        self.load_utxo(tx.tx_outs)
+
+        if self.journal is not None:
+            self.journal.append(tx)
+
+    def load_utxo(self, tx_outs):
+        """ Adds outputs to the UTXO database without recording a
+        transaction, e.g. when restoring a snapshot
+
+        Parameters
+        ----------
+        tx_outs: iterable
+            Transaction outputs of type TxOut
+
+        Returns
+        -------
+        none
+        """
+        for tx_out in tx_outs:
             self.utxo[tx_out.outpoint] = tx_out
+            owner = tx_out.public_key.to_string()
+            if self.snapshot is not None:
+                self.owner_outpoints(owner)
+            sequence = self._next_sequence()
+            self.owners.setdefault(owner, {})[tx_out.outpoint] = sequence
+            self.balances[owner] = self.balances.get(owner, 0) + tx_out.amount
+            if owner in self._pages:
+                sequences, page_outpoints = self._pages[owner]
+                sequences.append(sequence)
+                page_outpoints.append(tx_out.outpoint)
+
+    def load_snapshot(self, path):
+        """ Starts an empty bank from a memory-mapped snapshot written by
+        ownchain.snapshot.write_snapshot. Outputs, owners and balances are
+        read from the snapshot when they are used for the first time
+
+        Parameters
+        ----------
+        path: str
+            The snapshot file
+
+        Returns
+        -------
+        int
+            The generation of the snapshot
+        """
+        assert not self.utxo
+        self.snapshot = Snapshot(path, TxOut)
+        self.utxo = SnapshotUTXO(self.snapshot)
+        return self.snapshot.generation
+
+    def owner_outpoints(self, owner):
+        """ Get the outpoints of all UTXOs associated with the raw bytes of
+        a public key
+
+        Parameters
+        ----------
+        owner: bytes
+            The raw public key as returned by VerifyingKey.to_string()
+
+        Returns
+        -------
+        dict
+            The outpoints of the owner in insertion order associated with
+            their sequence number. Empty if the owner holds no UTXOs
+        """
+        if self.snapshot is not None and owner not in self._loaded_owners:
+            self._loaded_owners.add(owner)
+            balance, outpoints = self.snapshot.owner(owner)
+            if outpoints:
+                self.owners[owner] = {outpoint: self._next_sequence()
+                                      for outpoint in outpoints}
+                self.balances[owner] = balance
+        return self.owners.get(owner, {})
+
+    def _next_sequence(self):
+        self._sequence += 1
+        return self._sequence
 
     def issue(self, amount, public_key):
         """A method to issue new coins
@@ -277,7 +545,7 @@ class Bank:
         self.update_utxo(tx)
         return tx
 
-    def validate(self, tx):
+    def validate(self, tx, utxo=None):
         """Method to validate a transactions. That is, validate that the
         input transactions have not been spent and that the sum of the inputs
         is equal to the sum of the outputs
@@ -286,6 +554,9 @@ class Bank:
         ----------
         tx: Tx
             A transaction
+        utxo: mapping or None
+            The UTXOs the inputs are looked up in, e.g. the view of a
+            mempool. None uses the UTXO database of the bank
 
         Returns
         -------
@@ -294,20 +565,42 @@ class Bank:
         """
         in_sum = 0
         out_sum = 0
+        jobs = []
+        if utxo is None:
+            utxo = self.utxo
+
+        # an input spent twice would be counted twice
+        assert len({tx_in.outpoint for tx_in in tx.tx_ins}) == \
+            len(tx.tx_ins)
+        # the outputs are encoded once for all inputs
+        outputs_digest = tx.outputs_digest if tx.tx_ins else None
 
         for index, tx_in in enumerate(tx.tx_ins):
             # check if unspent
-            assert tx_in.outpoint in self.utxo
+            assert tx_in.outpoint in utxo
 
             # since inputs don't have amounts, we have to get the amount
             # from the associated outputs of a previous transaction
-            tx_out = self.utxo[tx_in.outpoint]
+            tx_out = utxo[tx_in.outpoint]
             pub_key = tx_out.public_key
-            tx.verify_input(index, pub_key)
+            if self.workers:
+                # defer the signature check to the process pool
+                jobs.append((pub_key.to_string(), tx_in.signature,
+                             spend_message(tx, index, outputs_digest)))
+            else:
+                tx.verify_input(index, pub_key, outputs_digest)
 
             # sum up inputs
             in_sum += tx_out.amount
 
+        if jobs and not all(verify_signatures(jobs, self.workers,
+                                              SIGNATURE_CACHE)):
+            raise BadSignatureError("Invalid signature in transaction input")
+
+        # outputs must not overwrite UTXOs, the indexes would get out of
+        # sync with the UTXO database
+        assert new_outputs(tx, utxo)
+
         # sum up outputs
         for tx_out in tx.tx_outs:
             out_sum += tx_out.amount
@@ -330,6 +623,114 @@ class Bank:
         self.validate(tx)
         self.update_utxo(tx)
 
+    def validate_txs(self, txs):
+        """Method to validate an ordered batch of transactions as a unit.
+        Transactions may spend outputs created by earlier transactions of the
+        batch. A transaction is rejected if it spends an output that is
+        unknown, already spent (also earlier in the batch) or created by a
+        rejected transaction, if a signature is invalid, if the sum of its
+        inputs is not equal to the sum of its outputs or if its outputs are
+        not new, see new_outputs. The database is not modified
+
+        Parameters
+        ----------
+        txs: list
+            An ordered list of transactions of type Tx
+
+        Returns
+        -------
+        list
+            A bool for each transaction. True if it would be accepted
+        """
+        batch_outputs = {tx_out.outpoint: tx_out
+                         for tx in txs for tx_out in tx.tx_outs}
+
+        # Check all signatures at once. The owner of an input is known
+        # even if the transaction creating it turns out to be rejected
+        jobs = []
+        job_tx = []
+        signed = [True] * len(txs)
+        for tx_index, tx in enumerate(txs):
+            if not tx.tx_ins:
+                continue
+            # struct.error and ValueError come from outputs that cannot be
+            # encoded for the spend message, e.g. negative amounts
+            try:
+                outputs_digest = tx.outputs_digest
+            except (TypeError, struct.error, ValueError):
+                signed[tx_index] = False
+                continue
+            for index, tx_in in enumerate(tx.tx_ins):
+                tx_out = self.utxo.get(tx_in.outpoint,
+                                       batch_outputs.get(tx_in.outpoint))
+                if tx_out is None:
+                    continue
+                if self.workers:
+                    jobs.append((tx_out.public_key.to_string(),
+                                 tx_in.signature,
+                                 spend_message(tx, index, outputs_digest)))
+                    job_tx.append(tx_index)
+                else:
+                    try:
+                        tx.verify_input(index, tx_out.public_key,
+                                        outputs_digest)
+                    except (BadSignatureError, TypeError):
+                        signed[tx_index] = False
+
+        if jobs:
+            results = verify_signatures(jobs, self.workers, SIGNATURE_CACHE)
+            for tx_index, valid in zip(job_tx, results):
+                signed[tx_index] = signed[tx_index] and valid
+
+        # Replay the batch in order against the database
+        spent = set()
+        created = {}
+        accepted = []
+        for tx, valid in zip(txs, signed):
+            in_sum = 0
+            outpoints = set()
+            for tx_in in tx.tx_ins:
+                outpoint = tx_in.outpoint
+                tx_out = created.get(outpoint, self.utxo.get(outpoint))
+                if tx_out is None or outpoint in spent \
+                   or outpoint in outpoints:
+                    valid = False
+                    break
+                outpoints.add(outpoint)
+                in_sum += tx_out.amount
+
+            valid = valid and in_sum == sum(tx_out.amount
+                                            for tx_out in tx.tx_outs) \
+                and new_outputs(tx, ChainMap(created, self.utxo))
+            if valid:
+                spent.update(outpoints)
+                created.update((tx_out.outpoint, tx_out)
+                               for tx_out in tx.tx_outs)
+            accepted.append(valid)
+
+        return accepted
+
+    def handle_txs(self, txs):
+        """Method to deal with an ordered batch of incoming transactions.
+        That is validate the batch as a unit and store the valid transactions
+        in database
+
+        Parameters
+        ----------
+        txs: list
+            An ordered list of transactions of type Tx
+
+        Returns
+        -------
+        list
+            A bool for each transaction. True if it was accepted
+        """
+        accepted = self.validate_txs(txs)
+        for tx, valid in zip(txs, accepted):
+            if valid:
+                self.update_utxo(tx)
+        return accepted
+
     def fetch_utxo(self, public_key):
         """Get all unspent transactions (UTXOs) that are associated
         with a specific public_key
@@ -345,9 +746,78 @@ class Bank:
             All output transactions associated with the public_key,
             but not in the spent list
         """
-        # left to_string, since ecdsa implemented an __eq__ literal
-        return [utxo for utxo in self.utxo.values()
-                if utxo.public_key.to_string() == public_key.to_string()]
+        outpoints = self.owner_outpoints(public_key.to_string())
+        return [self.utxo[outpoint] for outpoint in outpoints]
+
+    def fetch_utxo_page(self, public_key, cursor=None, limit=100):
+        """Get a page of the unspent transactions (UTXOs) associated with
+        a specific public_key. Pages follow the order in which the UTXOs
+        were created. UTXOs spent or created between two pages do not shift
+        the following pages
+
+        Parameters
+        ----------
+        public_key: ecdsa.keys.VerifyingKey
+            the public key of the client
+        cursor: int or None
+            The cursor returned with the previous page. None for the first
+            page
+        limit: int
+            The maximal number of UTXOs of the page
+
+        Returns
+        -------
+        tuple
+            The list of UTXOs and the cursor of the next page. The cursor
+            is None after the last page
+        """
+        assert limit > 0
+        owner = public_key.to_string()
+        outpoints = self.owner_outpoints(owner)
+        if not outpoints:
+            return [], None
+        if owner not in self._pages:
+            self._pages[owner] = (list(outpoints.values()), list(outpoints))
+        sequences, page_outpoints = self._pages[owner]
+
+        # seek the cursor, then skip the entries spent in the meantime
+        start = 0 if cursor is None else bisect.bisect_right(sequences, cursor)
+        page = []
+        next_cursor = None
+        for i in range(start, len(sequences)):
+            outpoint = page_outpoints[i]
+            if outpoints.get(outpoint) != sequences[i]:
+                continue
+            if len(page) == limit:
+                next_cursor = page_cursor
+                break
+            page.append(outpoint)
+            page_cursor = sequences[i]
+        return [self.utxo[outpoint] for outpoint in page], next_cursor
+
+    def fetch_utxo_covering(self, public_key, amount, strategy='min_inputs'):
+        """Get unspent transactions (UTXOs) associated with a specific
+        public_key that together cover at least an amount
+
+        Parameters
+        ----------
+        public_key: ecdsa.keys.VerifyingKey
+            the public key of the client
+        amount: int
+            The amount to be covered
+        strategy: str
+            The coin selection strategy, see utils.select_utxos
+
+        Returns
+        -------
+        list
+            The selected UTXOs. Empty if the balance does not cover the
+            amount
+        """
+        if self.fetch_balance(public_key) < amount:
+            return []
+        return select_utxos(self.fetch_utxo(public_key), amount,
+                            strategy).utxos
 
     def fetch_balance(self, public_key):
         """Get the balance for a specific public_key
@@ -362,8 +832,33 @@ class Bank:
         numeric (int or float)
             The balance of the account
         """
-        utxo = self.fetch_utxo(public_key)
-        return sum([tx_out.amount for tx_out in utxo])
+        owner = public_key.to_string()
+        self.owner_outpoints(owner)
+        return self.balances.get(owner, 0)
+
+    def check_balances(self):
+        """Recomputes all balances from the UTXO database and compares them
+        with the running balances. Meant for tests and for verifying the
+        ledger after a restart
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None. Raises AssertionError if the ledger is inconsistent
+        """
+        if self.snapshot is not None:
+            for owner in self.snapshot.keys():
+                self.owner_outpoints(owner)
+
+        balances = {}
+        for tx_out in self.utxo.values():
+            owner = tx_out.public_key.to_string()
+            balances[owner] = balances.get(owner, 0) + tx_out.amount
+
+        assert balances == self.balances
 
 
 ############################# Arg Parsing ######################################
@@ -376,19 +871,17 @@ Options:
   --help  Show this message and exit.
 
 Commands:
-  balance  Returns the balance of NAME
-  ping     Test connection
-  serve    Starts server
-  tx       Constructs transactions from FORM to TO with the amount AMOUNT...
+  balance   Returns the balance of NAME
+  loadtest  Measures a local server under concurrent load
+  ping      Test connection
+  serve     Starts server
+  tx        Constructs transactions from FORM to TO with the amount AMOUNT...
 """
 
 
 @click.group()
 def banknetcoin():
-
-    # simulate bank issuance
-    alice_public_key = user_public_key('alice')
-    BANK.issue(1000, alice_public_key)
+    pass
 
 
 @banknetcoin.command()
@@ -399,10 +892,81 @@ def ping():
 
 
 @banknetcoin.command()
-def serve():
+@click.option('--mode', type=click.Choice(['legacy', 'async']),
+              default='legacy', show_default=True,
+              help='legacy serves one connection at a time, async serves '
+                   'many connections concurrently')
+@click.option('--data-dir', type=click.Path(file_okay=False), default=None,
+              help='Directory to persist the bank in. Without it the bank '
+                   'only lives in memory')
+@click.option('--fsync-every', default=1, show_default=True,
+              help='Number of transactions after which the journal is synced')
+@click.option('--snapshot-every', default=10000, show_default=True,
+              help='Number of transactions after which a snapshot is written')
+@click.option('--mempool/--no-mempool', default=False, show_default=True,
+              help='Collect accepted transactions in a mempool and commit '
+                   'them in batches')
+@click.option('--batch-size', default=100, show_default=True,
+              help='Number of pending transactions that triggers a commit')
+@click.option('--commit-interval', default=1.0, show_default=True,
+              help='Seconds between two periodic commits of the mempool')
+@click.option('--mempool-size', default=10000, show_default=True,
+              help='Maximal number of pending transactions')
+def serve(mode, data_dir, fsync_every, snapshot_every, mempool, batch_size,
+          commit_interval, mempool_size):
     """Starts server
     """
-    serve()
+    global MEMPOOL
+    if mempool:
+        MEMPOOL = Mempool(BANK, max_size=mempool_size, batch_size=batch_size,
+                          interval=commit_interval)
+
+    if data_dir is not None:
+        journal = Journal(data_dir, fsync_every=fsync_every,
+                          snapshot_every=snapshot_every)
+        journal.restore(BANK)
+
+    # simulate bank issuance, once for a persistent bank
+    if not BANK.utxo:
+        alice_public_key = user_public_key('alice')
+        BANK.issue(1000, alice_public_key)
+
+    serve(mode=mode)
+
+
+@banknetcoin.command()
+@click.option('--mode', type=click.Choice(['legacy', 'async']),
+              default='async', show_default=True, help='The server to test')
+@click.option('--users', default=10, show_default=True,
+              help='Number of funded synthetic users')
+@click.option('--clients', default=4, show_default=True,
+              help='Number of concurrent clients, at most --users')
+@click.option('--requests', default=100, show_default=True,
+              help='Requests per client')
+@click.option('--mix', default='tx=1,balance=4,utxo=1,ping=1',
+              show_default=True,
+              help='Relative weights of tx, balance, utxo and ping requests')
+@click.option('--seed', default=0, show_default=True,
+              help='Seed of the random choices of the clients')
+@click.option('--output', type=click.File('w'), default='-',
+              help='File to write the JSON report to')
+def loadtest(mode, users, clients, requests, mix, seed, output):
+    """Measures a local server under concurrent load
+    """
+    # imported here since ownchain.loadtest imports this module
+    from ownchain.loadtest import parse_mix, run_loadtest
+
+    try:
+        mix = parse_mix(mix)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--mix')
+    if clients > users:
+        raise click.BadParameter("must not exceed --users",
+                                 param_hint='--clients')
+    report = run_loadtest(users=users, clients=clients, requests=requests,
+                          mix=mix, mode=mode, seed=seed)
+    json.dump(report, output, indent=2)
+    output.write("\n")
 
 
 @banknetcoin.command()
@@ -418,6 +982,8 @@ def balance(**kwargs):
 @click.argument('from')
 @click.argument('to')
 @click.argument('amount')
+@click.option('--strategy', type=click.Choice(STRATEGIES), default='first',
+              show_default=True, help='Coin selection strategy')
 def tx(**kwargs):
     """Constructs transactions from FORM to TO with the amount AMOUNT
 
@@ -427,12 +993,14 @@ def tx(**kwargs):
     sender_public_key = sender_private_key.get_verifying_key()
     receiver_public_key = user_public_key(kwargs['to'])
 
-    # fetch UTXOs
-    utxos = send_message("utxo", sender_public_key)
+    # fetch only the UTXOs needed for the amount
+    utxos = send_message("utxo-covering", (sender_public_key,
+                                           int(kwargs['amount']),
+                                           kwargs['strategy']))
 
     # construct Tx
     tx = prepare_tx(utxos['data'], sender_private_key, receiver_public_key,
-                    kwargs['amount'])
+                    kwargs['amount'], kwargs['strategy'])
 
     # send to bank
     response = send_message('tx', tx)
@@ -447,7 +1015,14 @@ def tx(**kwargs):
 HOST = "0.0.0.0"
 PORT = 10000
 ADDRESS = (HOST, PORT)
+MAX_FRAME_SIZE = 64 * 2**20  # bytes
+KEEPALIVE_TIMEOUT = 60  # seconds until servers close idle connections
+FRAME_HEADER = struct.Struct(">I")
+WRITE_COMMANDS = {'tx', 'txs'}  # commands that modify BANK
+UTXO_PAGE_SIZE = 100  # UTXOs per response of utxo-page
 BANK = Bank()  # Hack to make user simulation possible
+MEMPOOL = None  # if set, a Mempool committing transactions to BANK in batches
+_CLIENTS = {}  # mapping (address, max_frame_size) --> Client
 
 
 # Functions
@@ -471,60 +1046,609 @@ def prepare_message(command, data):
     }
 
 
-def serve():
+def serve(mode='legacy', address=ADDRESS):
     """ Starts the server
 
     Parameters
     ----------
+    mode: str
+        'legacy' for the socketserver based server that handles one
+        connection after the other, 'async' for the asyncio based server
+        that handles many connections concurrently
+    address: tuple
+        The host and port to listen on
+
+    Returns
+    -------
+    None
+    """
+    if mode == 'async':
+        asyncio.run(serve_async(address))
+    else:
+        server = MyTCPServer(address, TCPHandler)
+        if MEMPOOL is not None:
+            MEMPOOL.start(MyTCPServer.lock)
+        server.serve_forever()
+
+
+async def serve_async(address=ADDRESS):
+    """ Runs the asyncio based server forever
+
+    Parameters
+    ----------
+    address: tuple
+        The host and port to listen on
+
+    Returns
+    -------
+    None
+    """
+    server = await start_async_server(address)
+    async with server:
+        await server.serve_forever()
+
+
+async def start_async_server(address=ADDRESS, max_frame_size=MAX_FRAME_SIZE,
+                             keepalive_timeout=KEEPALIVE_TIMEOUT):
+    """ Starts the asyncio based server in the running event loop. Reads of
+    BANK are answered concurrently, writes are serialized by a lock
+
+    Parameters
+    ----------
+    address: tuple
+        The host and port to listen on
+    max_frame_size: int
+        The largest accepted message in bytes
+    keepalive_timeout: numeric
+        Seconds until an idle connection is closed
+
+    Returns
+    -------
+    asyncio.Server
+    """
+    lock = asyncio.Lock()
+
+    async def on_connection(reader, writer):
+        await handle_connection(reader, writer, lock, max_frame_size,
+                                keepalive_timeout)
+
+    server = await asyncio.start_server(on_connection, *address,
+                                        reuse_address=True)
+    if MEMPOOL is not None:
+        # keep a reference, the event loop only holds a weak one
+        server.commit_task = asyncio.create_task(commit_mempool(lock))
+    return server
+
+
+async def handle_connection(reader, writer, lock,
+                            max_frame_size=MAX_FRAME_SIZE,
+                            keepalive_timeout=KEEPALIVE_TIMEOUT):
+    """ Handles a connection to the asyncio based server. The connection is
+    kept open for further messages until the client closes it or it is idle
+    for keepalive_timeout seconds
+
+    Parameters
+    ----------
+    reader: asyncio.StreamReader
+        The incoming side of the connection
+    writer: asyncio.StreamWriter
+        The outgoing side of the connection
+    lock: asyncio.Lock
+        The lock that serializes writes to BANK
+    max_frame_size: int
+        The largest accepted message in bytes
+    keepalive_timeout: numeric
+        Seconds until an idle connection is closed
+
+    Returns
+    -------
     None
+    """
+    try:
+        while True:
+            message_data = await asyncio.wait_for(
+                read_frame(reader, max_frame_size), keepalive_timeout)
+            if message_data is None:
+                break
+            response = await handle_message_async(deserialize(message_data),
+                                                  lock)
+            await write_frame(writer, serialize(response))
+    except asyncio.TimeoutError:
+        pass
+    except (ConnectionError, ValueError) as error:
+        print(f"dropped connection: {error}")
+    finally:
+        writer.close()
+
+
+def send_frame(sock, payload):
+    """ Sends a frame, that is the payload prefixed with its length as
+    unsigned 32 bit big-endian integer
+
+    Parameters
+    ----------
+    sock: socket.socket
+        A connected socket
+    payload: bytes
+        The payload of the frame
+
+    Returns
+    -------
+    None
+    """
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_exactly(sock, size):
+    """ Receives exactly size bytes, however they are split into segments
+
+    Parameters
+    ----------
+    sock: socket.socket
+        A connected socket
+    size: int
+        The number of bytes to receive
+
+    Returns
+    -------
+    bytes
+        Raises ConnectionError if the peer closes the connection before
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("connection closed in the middle of a frame")
+        received += n
+    return bytes(buffer)
+
+
+def recv_frame(sock, max_frame_size=MAX_FRAME_SIZE):
+    """ Receives a complete frame sent by send_frame
+
+    Parameters
+    ----------
+    sock: socket.socket
+        A connected socket
+    max_frame_size: int
+        The largest accepted payload in bytes
+
+    Returns
+    -------
+    bytes or None
+        The payload. None if the peer closed the connection before sending
+        another frame. Raises ValueError if the frame is too large
+    """
+    first = sock.recv(1)
+    if not first:
+        return None
+    header = first + recv_exactly(sock, FRAME_HEADER.size - 1)
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > max_frame_size:
+        raise ValueError(f"frame of {size} bytes exceeds {max_frame_size}")
+    return recv_exactly(sock, size)
+
+
+async def read_frame(reader, max_frame_size=MAX_FRAME_SIZE):
+    """ Receives a complete frame from an asyncio stream, see recv_frame
+
+    Parameters
+    ----------
+    reader: asyncio.StreamReader
+        The incoming side of a connection
+    max_frame_size: int
+        The largest accepted payload in bytes
+
+    Returns
+    -------
+    bytes or None
+        The payload. None if the peer closed the connection before sending
+        another frame. Raises ValueError if the frame is too large
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise ConnectionError("connection closed in the middle of a frame")
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > max_frame_size:
+        raise ValueError(f"frame of {size} bytes exceeds {max_frame_size}")
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("connection closed in the middle of a frame")
+
+
+async def write_frame(writer, payload):
+    """ Sends a frame to an asyncio stream, see send_frame
+
+    Parameters
+    ----------
+    writer: asyncio.StreamWriter
+        The outgoing side of a connection
+    payload: bytes
+        The payload of the frame
 
     Returns
     -------
     None
     """
-    server = MyTCPServer(ADDRESS, TCPHandler)
-    server.serve_forever()
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
 
 
-def send_message(command, data):
-    """ Sends and receives message through a socket
+def exchange(sock, command, data, max_frame_size=MAX_FRAME_SIZE):
+    """ Sends a message through a connected socket and waits for the response
 
     Parameters
     ----------
+    sock: socket.socket
+        A socket connected to the server
     command: string
         A string representing a valid command in the network
     data: Pyhton object
         The data load to be able to execute the command
+    max_frame_size: int
+        The largest accepted response in bytes
 
     Returns
     -------
     The response of the server
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(ADDRESS)
-
     message = prepare_message(command, data)
-    serialized_message = serialize(message)
-    sock.sendall(serialized_message)
+    send_frame(sock, serialize(message))
+    return _recv_response(sock, max_frame_size)
+
+
+def _recv_response(sock, max_frame_size):
+    response_data = recv_frame(sock, max_frame_size)
+    if response_data is None:
+        raise ConnectionError("connection closed without response")
+    return deserialize(response_data)
+
+
+def get_client(address=ADDRESS, max_frame_size=MAX_FRAME_SIZE):
+    """ Returns the shared Client of an address, so that consecutive
+    messages reuse the same connection
+
+    Parameters
+    ----------
+    address: tuple
+        The host and port of the server
+    max_frame_size: int
+        The largest accepted response in bytes
+
+    Returns
+    -------
+    Client
+    """
+    key = (tuple(address), max_frame_size)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = Client(address, max_frame_size=max_frame_size)
+    return _CLIENTS[key]
 
-    response_data = sock.recv(20000)
-    response = deserialize(response_data)
+
+def send_message(command, data, address=ADDRESS,
+                 max_frame_size=MAX_FRAME_SIZE):
+    """ Sends and receives message through a (reused) connection
+
+    Parameters
+    ----------
+    command: string
+        A string representing a valid command in the network
+    data: Pyhton object
+        The data load to be able to execute the command
+    address: tuple
+        The host and port of the server
+    max_frame_size: int
+        The largest accepted response in bytes
+
+    Returns
+    -------
+    The response of the server
+    """
+    response = get_client(address, max_frame_size).send(command, data)
 
     print(f'Received: {response}')
 
     return response
 
 
+def handle_message(message):
+    """ Executes the command of a message on BANK
+
+    Parameters
+    ----------
+    message: dict
+        A message as constructed by prepare_message
+
+    Returns
+    -------
+    dict
+        The response message
+    """
+    command = message['command']
+
+    if command == 'ping':
+        return prepare_message("pong", "")
+
+    if command == 'balance':
+        public_key = message['data']
+        balance = BANK.fetch_balance(public_key)
+        return prepare_message("balance-response", balance)
+
+    if command == 'utxo':
+        public_key = message['data']
+        utxos = BANK.fetch_utxo(public_key)
+        return prepare_message("utxos", utxos)
+
+    if command == 'utxo-page':
+        public_key, cursor, limit = message['data']
+        limit = min(limit or UTXO_PAGE_SIZE, UTXO_PAGE_SIZE)
+        utxos, next_cursor = BANK.fetch_utxo_page(public_key, cursor, limit)
+        return prepare_message("utxos-page", (utxos, next_cursor))
+
+    if command == 'utxo-covering':
+        public_key, amount, strategy = message['data']
+        if strategy not in STRATEGIES:
+            return prepare_message('error', f'unknown strategy {strategy}')
+        utxos = BANK.fetch_utxo_covering(public_key, amount, strategy)
+        return prepare_message("utxos", utxos)
+
+    if command == 'mempool':
+        if MEMPOOL is None:
+            return prepare_message('error', 'no mempool')
+        return prepare_message('mempool-metrics', MEMPOOL.metrics())
+
+    if command in WRITE_COMMANDS and MEMPOOL is not None:
+        txs = [message['data']] if command == 'tx' else message['data']
+        accepted = _add_to_mempool(txs)
+        if MEMPOOL.due():
+            MEMPOOL.commit()
+        return _write_response(command, accepted)
+
+    if command == 'tx':
+        try:
+            BANK.handle_tx(message['data'])
+            return prepare_message('Transaction', 'accepted')
+        except:
+            return prepare_message('Transaction', 'rejected')
+
+    if command == 'txs':
+        try:
+            accepted = BANK.handle_txs(message['data'])
+            return prepare_message('Transactions',
+                                   ['accepted' if valid else 'rejected'
+                                    for valid in accepted])
+        except:
+            return prepare_message('Transactions', 'rejected')
+
+    return prepare_message('error', f'unknown command {command}')
+
+
+async def handle_message_async(message, lock):
+    """ Executes the command of a message on BANK inside the event loop.
+    Reads are answered right away. Writes wait for the lock, validate in
+    a worker thread so that reads continue meanwhile, and update the UTXO
+    database in the event loop thread so readers never see a partial update
+
+    Parameters
+    ----------
+    message: dict
+        A message as constructed by prepare_message
+    lock: asyncio.Lock
+        The lock that serializes writes to BANK
+
+    Returns
+    -------
+    dict
+        The response message
+    """
+    command = message['command']
+    if command not in WRITE_COMMANDS:
+        return handle_message(message)
+
+    loop = asyncio.get_running_loop()
+    async with lock:
+        if MEMPOOL is not None:
+            txs = [message['data']] if command == 'tx' else message['data']
+            accepted = await loop.run_in_executor(None, _add_to_mempool, txs)
+            if MEMPOOL.due():
+                MEMPOOL.commit()
+            return _write_response(command, accepted)
+
+        if command == 'tx':
+            tx = message['data']
+            try:
+                await loop.run_in_executor(None, BANK.validate, tx)
+                BANK.update_utxo(tx)
+                return prepare_message('Transaction', 'accepted')
+            except:
+                return prepare_message('Transaction', 'rejected')
+
+        try:
+            txs = message['data']
+            accepted = await loop.run_in_executor(None, BANK.validate_txs,
+                                                  txs)
+            for tx, valid in zip(txs, accepted):
+                if valid:
+                    BANK.update_utxo(tx)
+            return prepare_message('Transactions',
+                                   ['accepted' if valid else 'rejected'
+                                    for valid in accepted])
+        except:
+            return prepare_message('Transactions', 'rejected')
+
+
+async def commit_mempool(lock):
+    """ Commits MEMPOOL periodically inside the event loop
+
+    Parameters
+    ----------
+    lock: asyncio.Lock
+        The lock that serializes writes to BANK
+
+    Returns
+    -------
+    None
+    """
+    while True:
+        await asyncio.sleep(MEMPOOL.interval)
+        async with lock:
+            MEMPOOL.commit()
+
+
+def _add_to_mempool(txs):
+    # a malformed transaction only rejects itself, the transactions before
+    # it stay pending and have to be reported as accepted
+    accepted = []
+    for tx in txs:
+        try:
+            accepted.append(MEMPOOL.add(tx))
+        except:
+            accepted.append(False)
+    return accepted
+
+
+def _write_response(command, accepted):
+    # the response to tx and txs commands
+    if command == 'tx':
+        return prepare_message('Transaction',
+                               'accepted' if accepted[0] else 'rejected')
+    return prepare_message('Transactions',
+                           ['accepted' if valid else 'rejected'
+                            for valid in accepted])
+
+
 # Classes
-class MyTCPServer(socketserver.TCPServer):
+class Client:
+    """ A client that keeps connections to the server open and reuses them
+    for further messages
+
+    Attributes
+    ----------
+    address: tuple
+        The host and port of the server
+    pool_size: int
+        The maximal number of idle connections kept open
+    max_frame_size: int
+        The largest accepted response in bytes
+
+    Methods
+    -------
+    send
+        Sends a message and returns the response of the server
+    close
+        Closes all idle connections
+    """
+    def __init__(self, address=ADDRESS, pool_size=4,
+                 max_frame_size=MAX_FRAME_SIZE):
+        self.address = address
+        self.pool_size = pool_size
+        self.max_frame_size = max_frame_size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, command, data):
+        """ Sends a message and returns the response of the server. An idle
+        connection is used if there is one. If the server has closed it in
+        the meantime, the message is sent once more on a new connection.
+        Commands of WRITE_COMMANDS are only sent again if they could not be
+        written at all, since the server may have applied them already
+
+        Parameters
+        ----------
+        command: string
+            A string representing a valid command in the network
+        data: Pyhton object
+            The data load to be able to execute the command
+
+        Returns
+        -------
+        The response of the server
+        """
+        with self._lock:
+            sock = self._idle.pop() if self._idle else None
+
+        if sock is not None:
+            written = False
+            try:
+                send_frame(sock, serialize(prepare_message(command, data)))
+                written = True
+                response = _recv_response(sock, self.max_frame_size)
+            except OSError:
+                sock.close()
+                if written and command in WRITE_COMMANDS:
+                    raise
+                sock = None
+            except:
+                sock.close()
+                raise
+
+        if sock is None:
+            sock = socket.create_connection(self.address)
+            try:
+                response = exchange(sock, command, data, self.max_frame_size)
+            except:
+                sock.close()
+                raise
+
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+
+        return response
+
+    def close(self):
+        """ Closes all idle connections
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+
+class MyTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """ Own TCPServer class. Only purpose is to set certain flags.
-    Here: To allow address reuse
+    Here: To allow address reuse, to limit the size of incoming frames and
+    to keep connections open. Every connection gets its own thread, but
+    messages are still handled one at a time
 
     Attributes
     ----------
     Inherits from socketserver.TCPServer
+    max_frame_size: int
+        The largest accepted message in bytes
+    keepalive_timeout: numeric
+        Seconds until an idle connection is closed
+    lock: threading.Lock
+        Serializes the handling of messages
     """
     allow_reuse_address = True
+    daemon_threads = True
+    max_frame_size = MAX_FRAME_SIZE
+    keepalive_timeout = KEEPALIVE_TIMEOUT
+    lock = threading.Lock()
 
 
 class TCPHandler(socketserver.BaseRequestHandler):
@@ -542,23 +1666,19 @@ class TCPHandler(socketserver.BaseRequestHandler):
         handles incoming messages and responds accordingly
     """
 
-    def respond(self, command, data):
+    def respond(self, message):
         """ Sends serialized messages. Used by handle is a response is required
 
         Parameters
         ----------
-        command: string
-            A string representing a valid command in the network
-        data: Pyhton object
-            The data load to be able to execute the command
+        message: dict
+            A message as constructed by prepare_message
 
         Returns
         -------
         None
         """
-        message = prepare_message(command, data)
-        serialized_message = serialize(message)
-        self.request.sendall(serialized_message)
+        send_frame(self.request, serialize(message))
 
     def handle(self):
         """ Handles incoming messages and responds accordingly
@@ -571,30 +1691,21 @@ class TCPHandler(socketserver.BaseRequestHandler):
         -------
         None. Any reponse is sent to the respond method
         """
-        message_data = self.request.recv(20000)
-        message = deserialize(message_data)
-        command = message['command']
-        print(f"got a message {message}")
-
-        if command == 'ping':
-            self.respond("pong", "")
-
-        if command == 'balance':
-            public_key = message['data']
-            balance = BANK.fetch_balance(public_key)
-            self.respond("balance-response", balance)
-
-        if command == 'utxo':
-            public_key = message['data']
-            utxos = BANK.fetch_utxo(public_key)
-            self.respond("utxos", utxos)
-
-        if command == 'tx':
+        self.request.settimeout(self.server.keepalive_timeout)
+        while True:
             try:
-                BANK.handle_tx(message['data'])
-                self.respond('Transaction', 'accepted')
-            except:
-                self.respond('Transaction', 'rejected')
+                message_data = recv_frame(self.request,
+                                          self.server.max_frame_size)
+            except socket.timeout:
+                return
+            if message_data is None:
+                return
+            message = deserialize(message_data)
+            print(f"got a message {message['command']}")
+
+            with self.server.lock:
+                response = handle_message(message)
+            self.respond(response)
 
 
 # Main
@@ -0,0 +1,283 @@
+""" A compact, versioned binary format for the transactions and network
+messages of BankNetCoin. Used by ownchain.utils.serialize instead of pickle
+whenever an object consists only of the supported types.
+
+Every encoded object starts with MAGIC followed by a single tagged value.
+Transaction IDs are written as their 16 raw bytes, public keys as their
+64 raw bytes (SECP256k1) and indices, amounts and lengths as varints.
+
+For teaching purposes only.
+
+Contains the following constants:
+    * MAGIC
+    * VERSION
+
+Contains the following functions:
+    * encode
+    * decode
+"""
+from uuid import UUID
+from ecdsa import VerifyingKey, SECP256k1
+from ownchain.utils import encode_varint, decode_varint
+from ownchain.banknetcoin import Tx, TxIn, TxOut
+
+# Constants
+VERSION = 1
+MAGIC = b'OWN' + bytes([VERSION])
+KEY_SIZE = 64
+
+# Tags of the encoded values
+NONE = 0x00
+FALSE = 0x01
+TRUE = 0x02
+INT = 0x03
+NEG_INT = 0x04
+STR = 0x05
+BYTES = 0x06
+LIST = 0x07
+TUPLE = 0x08
+UUID_ = 0x09
+KEY = 0x0a
+TX_IN = 0x0b
+TX_OUT = 0x0c
+TX = 0x0d
+MESSAGE = 0x0e
+
+
+# Functions
+def encode(obj):
+    """ Encodes an object in the binary format
+
+    Parameters
+    ----------
+    obj: Python object
+        A Tx, TxIn, TxOut, network message (a dict with exactly the keys
+        command and data) or a list or tuple of supported values. Supported
+        values are also None, bool, int, str, bytes, uuid.UUID and SECP256k1
+        public keys
+
+    Returns
+    -------
+    bytes
+        Raises TypeError or ValueError if obj cannot be encoded
+    """
+    out = bytearray(MAGIC)
+    _Encoder(out).value(obj)
+    return bytes(out)
+
+
+def decode(data):
+    """ Decodes an object written by encode
+
+    Parameters
+    ----------
+    data: bytes
+        The encoded object including MAGIC
+
+    Returns
+    -------
+    A Python object. Raises ValueError on malformed data
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("unknown format or version")
+    decoder = _Decoder(data, len(MAGIC))
+    obj = decoder.value()
+    if decoder.offset != len(data):
+        raise ValueError("trailing data")
+    return obj
+
+
+# Classes
+class _Encoder:
+    """ Writes tagged values into a bytearray. Raw public keys are memorized
+    since the same key usually occurs many times in a message
+    """
+    def __init__(self, out):
+        self.out = out
+        # mapping id(public_key) --> raw key bytes
+        self.keys = {}
+
+    def value(self, obj):
+        out = self.out
+        if obj is None:
+            out.append(NONE)
+        elif obj is True:
+            out.append(TRUE)
+        elif obj is False:
+            out.append(FALSE)
+        elif isinstance(obj, int):
+            if obj < 0:
+                out.append(NEG_INT)
+                out += encode_varint(-obj)
+            else:
+                out.append(INT)
+                out += encode_varint(obj)
+        elif isinstance(obj, str):
+            out.append(STR)
+            self.bytes(obj.encode())
+        elif isinstance(obj, bytes):
+            out.append(BYTES)
+            self.bytes(obj)
+        elif isinstance(obj, (list, tuple)):
+            out.append(LIST if isinstance(obj, list) else TUPLE)
+            out += encode_varint(len(obj))
+            for item in obj:
+                self.value(item)
+        elif isinstance(obj, UUID):
+            out.append(UUID_)
+            out += obj.bytes
+        elif isinstance(obj, VerifyingKey):
+            out.append(KEY)
+            self.key(obj)
+        elif isinstance(obj, TxIn):
+            out.append(TX_IN)
+            self.tx_in(obj)
+        elif isinstance(obj, TxOut):
+            out.append(TX_OUT)
+            self.tx_out(obj)
+        elif isinstance(obj, Tx):
+            out.append(TX)
+            self.tx(obj)
+        elif isinstance(obj, dict) and obj.keys() == {"command", "data"} \
+                and isinstance(obj["command"], str):
+            out.append(MESSAGE)
+            self.bytes(obj["command"].encode())
+            self.value(obj["data"])
+        else:
+            raise TypeError(f"cannot encode {type(obj).__name__}")
+
+    def bytes(self, data):
+        self.out += encode_varint(len(data))
+        self.out += data
+
+    def key(self, public_key):
+        raw = self.keys.get(id(public_key))
+        if raw is None:
+            if public_key.curve != SECP256k1:
+                raise TypeError("only SECP256k1 keys can be encoded")
+            raw = public_key.to_string()
+            self.keys[id(public_key)] = raw
+        self.out += raw
+
+    def tx_in(self, tx_in):
+        self.out += tx_in.tx_id.bytes
+        self.out += encode_varint(tx_in.index)
+        if tx_in.signature is None:
+            self.out.append(NONE)
+        else:
+            self.out.append(BYTES)
+            self.bytes(tx_in.signature)
+
+    def tx_out(self, tx_out):
+        self.out += tx_out.tx_id.bytes
+        self.out += encode_varint(tx_out.index)
+        if not isinstance(tx_out.amount, int):
+            raise TypeError("only integer amounts can be encoded")
+        self.out += encode_varint(tx_out.amount)
+        self.key(tx_out.public_key)
+
+    def tx(self, tx):
+        self.out += tx.id.bytes
+        self.out += encode_varint(len(tx.tx_ins))
+        for tx_in in tx.tx_ins:
+            self.tx_in(tx_in)
+        self.out += encode_varint(len(tx.tx_outs))
+        for tx_out in tx.tx_outs:
+            self.tx_out(tx_out)
+
+
+class _Decoder:
+    """ Reads tagged values from bytes. Public keys are constructed only once
+    per distinct key
+    """
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+        # mapping raw key bytes --> VerifyingKey
+        self.keys = {}
+
+    def take(self, size):
+        start = self.offset
+        self.offset += size
+        if self.offset > len(self.data):
+            raise ValueError("truncated data")
+        return self.data[start:self.offset]
+
+    def varint(self):
+        # most indices and lengths fit into a single byte
+        offset = self.offset
+        if offset < len(self.data) and self.data[offset] < 0x80:
+            self.offset = offset + 1
+            return self.data[offset]
+        value, self.offset = decode_varint(self.data, offset)
+        return value
+
+    def value(self):
+        tag = self.take(1)[0]
+        if tag == NONE:
+            return None
+        if tag == TRUE:
+            return True
+        if tag == FALSE:
+            return False
+        if tag == INT:
+            return self.varint()
+        if tag == NEG_INT:
+            return -self.varint()
+        if tag == STR:
+            return self.bytes().decode()
+        if tag == BYTES:
+            return self.bytes()
+        if tag in (LIST, TUPLE):
+            items = [self.value() for _ in range(self.varint())]
+            return items if tag == LIST else tuple(items)
+        if tag == UUID_:
+            return self.uuid()
+        if tag == KEY:
+            return self.key()
+        if tag == TX_IN:
+            return self.tx_in()
+        if tag == TX_OUT:
+            return self.tx_out()
+        if tag == TX:
+            return self.tx()
+        if tag == MESSAGE:
+            command = self.bytes().decode()
+            return {"command": command, "data": self.value()}
+        raise ValueError(f"unknown tag {tag}")
+
+    def bytes(self):
+        return bytes(self.take(self.varint()))
+
+    def uuid(self):
+        return UUID(bytes=bytes(self.take(16)))
+
+    def key(self):
+        raw = bytes(self.take(KEY_SIZE))
+        public_key = self.keys.get(raw)
+        if public_key is None:
+            public_key = VerifyingKey.from_string(raw, curve=SECP256k1)
+            self.keys[raw] = public_key
+        return public_key
+
+    def tx_in(self):
+        tx_id = self.uuid()
+        index = self.varint()
+        tag = self.take(1)[0]
+        if tag not in (NONE, BYTES):
+            raise ValueError(f"unexpected tag {tag}")
+        signature = self.bytes() if tag == BYTES else None
+        return TxIn(tx_id=tx_id, index=index, signature=signature)
+
+    def tx_out(self):
+        tx_id = self.uuid()
+        index = self.varint()
+        amount = self.varint()
+        return TxOut(tx_id=tx_id, index=index, amount=amount,
+                     public_key=self.key())
+
+    def tx(self):
+        id = self.uuid()
+        tx_ins = [self.tx_in() for _ in range(self.varint())]
+        tx_outs = [self.tx_out() for _ in range(self.varint())]
+        return Tx(id=id, tx_ins=tx_ins, tx_outs=tx_outs)
@@ -4,10 +4,13 @@ A few functions to simulate users in the system
 Contains the following constants:
     * alice_private_key
     * bob_private_key
+    * SYNTHETIC_PREFIX
+    * SYNTHETIC_OFFSET
 
 Contains the following functions:
     * user_private_key
     * user_public_key
+    * synthetic_users
 """
 
 from ecdsa import SigningKey, SECP256k1
@@ -16,13 +19,37 @@ alice_private_key = SigningKey.from_secret_exponent(1, curve=SECP256k1)
 
 bob_private_key = SigningKey.from_secret_exponent(2, curve=SECP256k1)
 
+# synthetic users are named user0, user1, ... and have deterministic keys
+SYNTHETIC_PREFIX = "user"
+SYNTHETIC_OFFSET = 1000
+
 def user_private_key(name):
     name_to_key = {
         "alice": alice_private_key,
         "bob": bob_private_key
     }
+    if name not in name_to_key and name.startswith(SYNTHETIC_PREFIX) and \
+       name[len(SYNTHETIC_PREFIX):].isdigit():
+        number = int(name[len(SYNTHETIC_PREFIX):])
+        return SigningKey.from_secret_exponent(SYNTHETIC_OFFSET + number,
+                                               curve=SECP256k1)
     return name_to_key[name]
 
 def user_public_key(name):
     private_key = user_private_key(name)
     return private_key.get_verifying_key()
+
+def synthetic_users(count):
+    """ Names of synthetic users for simulations with more than alice and bob
+
+    Parameters
+    ----------
+    count: int
+        The number of users
+
+    Returns
+    -------
+    list
+        The names user0, user1, ... that can be passed to user_private_key
+    """
+    return [f"{SYNTHETIC_PREFIX}{number}" for number in range(count)]
@@ -0,0 +1,187 @@
+""" Persistence of the BankNetCoin bank. Every transaction applied to the
+UTXO database is appended to a journal and the complete UTXO database is
+written to a snapshot from time to time. On start-up the latest snapshot is
+loaded and only the journal written after it is replayed, so the restart
+time does not grow with the length of the history.
+
+Snapshots and journals are numbered by a generation. The snapshot of
+generation g contains everything up to the start of the journal of
+generation g. A snapshot is written to a temporary file and renamed, so a
+crash leaves either the old or the new snapshot behind. Snapshots use the
+memory-mapped format of ownchain.snapshot, so loading one does not read
+the UTXO database.
+
+For teaching purposes only.
+
+Contains the following classes:
+    * Journal
+"""
+import os
+import struct
+from ownchain.utils import serialize, deserialize
+from ownchain.snapshot import write_snapshot
+
+# Constants
+SNAPSHOT = "snapshot"
+RECORD_HEADER = struct.Struct(">I")
+
+
+class Journal:
+    """ An append-only journal of the transactions applied to a bank plus
+    periodic snapshots of its UTXO database
+
+    Attributes
+    ----------
+    directory: str
+        The directory holding the snapshot and the journal
+    fsync_every: int
+        Number of appended transactions after which the journal is synced
+        to disk. Transactions are always handed to the operating system
+        right away, so only a crash of the machine can lose the last ones
+    snapshot_every: int
+        Number of appended transactions after which a snapshot is written
+    generation: int
+        The generation of the current snapshot and journal
+    bank: banknetcoin.Bank
+        The bank whose transactions are recorded
+
+    Methods
+    -------
+    restore
+        Loads the latest state into a bank and starts recording it
+    append
+        Appends a transaction to the journal
+    snapshot
+        Writes the UTXO database to a new snapshot and starts a new journal
+    close
+        Syncs and closes the journal
+    """
+    def __init__(self, directory, fsync_every=1, snapshot_every=10000):
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.bank = None
+        self._file = None
+        self._unsynced = 0
+        self._records = 0
+
+    def _journal_path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation}.log")
+
+    def restore(self, bank):
+        """ Loads the latest snapshot into an empty bank, replays the journal
+        written after it and records all further updates of the bank
+
+        Parameters
+        ----------
+        bank: banknetcoin.Bank
+            An empty bank
+
+        Returns
+        -------
+        None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(snapshot_path):
+            self.generation = bank.load_snapshot(snapshot_path)
+
+        path = self._journal_path(self.generation)
+        valid_size = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            while valid_size + RECORD_HEADER.size <= len(data):
+                (size,) = RECORD_HEADER.unpack_from(data, valid_size)
+                end = valid_size + RECORD_HEADER.size + size
+                if end > len(data):
+                    break
+                bank.update_utxo(
+                    deserialize(data[valid_size + RECORD_HEADER.size:end]))
+                valid_size = end
+                self._records += 1
+
+        # drop a record that was only partially written before a crash
+        self._file = open(path, "ab")
+        self._file.truncate(valid_size)
+        self._remove_old_journals()
+
+        self.bank = bank
+        bank.journal = self
+
+    def append(self, tx):
+        """ Appends a transaction to the journal. Syncs and writes a snapshot
+        as configured
+
+        Parameters
+        ----------
+        tx: banknetcoin.Tx
+            A transaction that has just been applied to the bank
+
+        Returns
+        -------
+        None
+        """
+        record = serialize(tx)
+        self._file.write(RECORD_HEADER.pack(len(record)) + record)
+        self._file.flush()
+        self._records += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+        if self._records >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """ Writes the UTXO database of the bank to a new snapshot and starts
+        a new, empty journal
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        generation = self.generation + 1
+        snapshot_path = os.path.join(self.directory, SNAPSHOT)
+        tmp_path = snapshot_path + ".tmp"
+        write_snapshot(tmp_path, generation, self.bank.utxo.values())
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+        self.close()
+        self.generation = generation
+        self._file = open(self._journal_path(generation), "ab")
+        self._records = 0
+        self._remove_old_journals()
+
+    def close(self):
+        """ Syncs and closes the journal
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._unsynced = 0
+
+    def _remove_old_journals(self):
+        for name in os.listdir(self.directory):
+            if name.startswith("journal-") and name.endswith(".log") and \
+               int(name[len("journal-"):-len(".log")]) < self.generation:
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,274 @@
+""" A load generator for the BankNetCoin server. Starts a local server with a
+fresh bank, funds synthetic users and drives a configurable mix of
+requests from concurrent clients. Throughput, latency percentiles and
+rejection rates are reported as a dictionary ready to be dumped as JSON.
+
+Every client runs in its own thread with its own connection. A tx request
+fetches the UTXOs covering the amount, signs a transaction and sends it,
+so its latency is that of a complete transfer as seen by a wallet. The
+senders are split among the clients, so transactions only get rejected if
+the server rejects them, not because two clients spent the same UTXO.
+
+For teaching purposes only.
+
+Contains the following constants:
+    * OPERATIONS
+    * DEFAULT_MIX
+    * PERCENTILES
+
+Contains the following functions:
+    * parse_mix
+    * percentile
+    * start_server
+    * run_loadtest
+"""
+import time
+import random
+import asyncio
+import threading
+from ownchain import banknetcoin
+from ownchain.banknetcoin import Bank, Client, MyTCPServer, TCPHandler, \
+    start_async_server
+from ownchain.example_users import user_private_key, synthetic_users
+from ownchain.utils import prepare_tx
+
+# Constants
+OPERATIONS = ('tx', 'balance', 'utxo', 'ping')
+DEFAULT_MIX = "tx=1,balance=4,utxo=1,ping=1"
+PERCENTILES = (50, 95, 99)
+
+
+# Functions
+def parse_mix(text):
+    """ Parses a request mix such as "tx=1,balance=4"
+
+    Parameters
+    ----------
+    text: str
+        Comma separated pairs of an operation of OPERATIONS and its
+        relative weight
+
+    Returns
+    -------
+    dict
+        The weight associated with each operation. Raises ValueError on
+        unknown operations or invalid weights
+    """
+    mix = {}
+    for part in text.split(","):
+        operation, _, weight = part.strip().partition("=")
+        if operation not in OPERATIONS:
+            raise ValueError(f"unknown operation {operation!r}")
+        try:
+            mix[operation] = float(weight)
+        except ValueError:
+            raise ValueError(f"invalid weight {weight!r} of {operation}")
+        if mix[operation] < 0:
+            raise ValueError(f"negative weight of {operation}")
+    if not any(mix.values()):
+        raise ValueError("the mix contains no requests")
+    return mix
+
+
+def percentile(values, p):
+    """ The nearest-rank percentile of sorted values
+
+    Parameters
+    ----------
+    values: list
+        Sorted numbers
+    p: numeric
+        The percentile between 0 and 100
+
+    Returns
+    -------
+    numeric or None
+        None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def start_server(mode):
+    """ Starts a server on a free local port in a background thread
+
+    Parameters
+    ----------
+    mode: str
+        'legacy' or 'async', see banknetcoin.serve
+
+    Returns
+    -------
+    tuple
+        The address of the server and a function that stops it
+    """
+    if mode == 'legacy':
+        server = MyTCPServer(('127.0.0.1', 0), TCPHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        return server.server_address, stop
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_async_server(('127.0.0.1', 0)))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+
+    async def shutdown():
+        server.close()
+        await server.wait_closed()
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return server.sockets[0].getsockname(), stop
+
+
+def _run_client(address, senders, receivers, keys, mix, requests, amount,
+                seed, results):
+    rng = random.Random(seed)
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+
+    with Client(address, pool_size=1) as client:
+        for _ in range(requests):
+            operation = rng.choices(operations, weights)[0]
+            private_key, public_key = keys[rng.choice(senders)]
+
+            start = time.perf_counter()
+            if operation == 'tx':
+                utxos = client.send('utxo-covering',
+                                    (public_key, amount, 'first'))['data']
+                if utxos:
+                    receiver = keys[rng.choice(receivers)][1]
+                    tx = prepare_tx(utxos, private_key, receiver, amount)
+                    response = client.send('tx', tx)
+                    rejected = response['data'] != 'accepted'
+                else:
+                    rejected = True
+            else:
+                data = '' if operation == 'ping' else public_key
+                response = client.send(operation, data)
+                rejected = response['command'] == 'error'
+            results.append((operation, time.perf_counter() - start,
+                            rejected))
+
+
+def _summary(latencies, rejected, duration):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rejected": rejected,
+        "rejection_rate": rejected / len(latencies) if latencies else 0.0,
+        "throughput": len(latencies) / duration,
+        "latency_ms": {f"p{p}": (None if not latencies else
+                                 percentile(latencies, p) * 1000)
+                       for p in PERCENTILES},
+    }
+
+
+def run_loadtest(users=10, clients=4, requests=100, mix=None, mode='async',
+                 amount=1, funds=1000, seed=0):
+    """ Starts a local server, funds synthetic users and measures the
+    server under concurrent clients. The server uses a fresh bank that
+    replaces banknetcoin.BANK for the duration of the test
+
+    Parameters
+    ----------
+    users: int
+        The number of synthetic users, see example_users.synthetic_users
+    clients: int
+        The number of concurrent clients. At most users, since every
+        client needs senders of its own
+    requests: int
+        The number of requests sent by each client
+    mix: dict or None
+        Relative weights of the operations as returned by parse_mix.
+        None uses DEFAULT_MIX
+    mode: str
+        'legacy' or 'async', see banknetcoin.serve
+    amount: int
+        The amount of every transaction
+    funds: int
+        The coins issued to every user before the test
+    seed: int
+        Seed of the random choices of the clients
+
+    Returns
+    -------
+    dict
+        The configuration, the overall throughput (requests per second),
+        latency percentiles in milliseconds and rejection rate, and the
+        same figures per operation
+    """
+    assert users > 0 and clients > 0 and requests > 0
+    # clients sharing a sender would race for its UTXOs
+    assert users >= clients, "every client needs a sender of its own"
+    if mix is None:
+        mix = parse_mix(DEFAULT_MIX)
+
+    names = synthetic_users(users)
+    keys = {}
+    for name in names:
+        private_key = user_private_key(name)
+        keys[name] = (private_key, private_key.get_verifying_key())
+
+    bank = Bank()
+    for name in names:
+        bank.issue(funds, keys[name][1])
+
+    previous_bank = banknetcoin.BANK
+    banknetcoin.BANK = bank
+    address, stop = start_server(mode)
+    try:
+        results = [[] for _ in range(clients)]
+        threads = [
+            threading.Thread(target=_run_client, args=(
+                address, names[i::clients], names, keys, mix,
+                requests, amount, seed + i, results[i]))
+            for i in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+    finally:
+        stop()
+        banknetcoin.BANK = previous_bank
+
+    results = [result for client_results in results
+               for result in client_results]
+    report = {
+        "mode": mode,
+        "users": users,
+        "clients": clients,
+        "mix": mix,
+        "duration_s": duration,
+    }
+    report.update(_summary([latency for _, latency, _ in results],
+                           sum(rejected for _, _, rejected in results),
+                           duration))
+    report["operations"] = {
+        operation: _summary(
+            [latency for op, latency, _ in results if op == operation],
+            sum(rejected for op, _, rejected in results if op == operation),
+            duration)
+        for operation in OPERATIONS if operation in mix
+    }
+    return report
@@ -0,0 +1,327 @@
+""" A pool of accepted but not yet committed transactions for BankNetCoin.
+Transactions are validated against the UTXO database of the bank plus the
+outputs of pending transactions, so a transaction may spend outputs of
+another transaction that is still in the pool. A transaction spending an
+output that a pending transaction already spends is rejected right away.
+
+The pool is committed to the bank in batches, either when it reaches a size
+threshold or periodically. Pending transactions are kept in arrival order,
+which is a valid commit order since a transaction can only be accepted after
+the transactions it spends from. If a pending transaction turns out to be
+invalid at commit time, it is evicted together with all transactions
+spending from it.
+
+For teaching purposes only.
+
+Contains the following classes:
+    * Mempool
+"""
+import time
+import struct
+import threading
+from collections import ChainMap
+from ecdsa import BadSignatureError
+from ownchain.utils import new_outputs
+
+
+class _PoolView:
+    """ The UTXOs as seen by a new transaction: the UTXO database of the
+    bank plus the outputs of pending transactions minus the outputs spent
+    by pending transactions
+    """
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __contains__(self, outpoint):
+        return outpoint not in self.pool._spends and \
+            (outpoint in self.pool._creates or outpoint in self.pool.bank.utxo)
+
+    def __getitem__(self, outpoint):
+        tx_out = self.pool._creates.get(outpoint)
+        if tx_out is None:
+            tx_out = self.pool.bank.utxo[outpoint]
+        return tx_out
+
+
+class Mempool:
+    """ A pool of pending transactions that is committed to a bank in
+    batches
+
+    Attributes
+    ----------
+    bank: banknetcoin.Bank
+        The bank the transactions are committed to
+    max_size: int
+        The maximal number of pending transactions. Further transactions
+        are rejected until the next commit
+    batch_size: int
+        The number of pending transactions from which on a commit is due
+    interval: numeric
+        Seconds between two periodic commits
+
+    Methods
+    -------
+    add
+        Validates a transaction and adds it to the pool
+    due
+        Tells whether the pool has reached the batch size
+    commit
+        Commits all pending transactions to the bank
+    evict
+        Removes a transaction and all transactions spending from it
+    metrics
+        Size, eviction and commit latency figures of the pool
+    start
+        Commits periodically in a background thread
+    stop
+        Stops the background thread
+    """
+    def __init__(self, bank, max_size=10000, batch_size=100, interval=1.0):
+        self.bank = bank
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        # mapping tx.id --> tx, in arrival order
+        self._txs = {}
+        # mapping tx.id --> time of acceptance
+        self._accepted_at = {}
+        # mapping (tx_id, index) --> id of the pending tx spending it
+        self._spends = {}
+        # mapping (tx_id, index) --> tx_out created by a pending tx
+        self._creates = {}
+        # mapping tx.id --> ids of the pending txs spending its outputs
+        self._children = {}
+        self._view = _PoolView(self)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = dict.fromkeys(
+            ['accepted', 'rejected', 'conflicts', 'rejected_full', 'evicted',
+             'committed', 'batches'], 0)
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._last_batch_size = 0
+        self._last_commit_seconds = 0.0
+
+    def __len__(self):
+        return len(self._txs)
+
+    def __contains__(self, tx_id):
+        return tx_id in self._txs
+
+    def add(self, tx):
+        """ Validates a transaction against the bank and the pending
+        transactions and adds it to the pool
+
+        Parameters
+        ----------
+        tx: banknetcoin.Tx
+            A transaction
+
+        Returns
+        -------
+        bool
+            True if the transaction was accepted. False if it is invalid,
+            conflicts with a pending transaction or the pool is full
+        """
+        with self._lock:
+            if len(self._txs) >= self.max_size:
+                self._counters['rejected_full'] += 1
+                return False
+            if tx.id in self._txs or \
+               any(tx_in.outpoint in self._spends for tx_in in tx.tx_ins):
+                self._counters['conflicts'] += 1
+                return False
+            outpoints = {tx_in.outpoint for tx_in in tx.tx_ins}
+            # an output spent twice would be counted twice. An output must
+            # not replace a UTXO even if a pending transaction spends it,
+            # that one might still be evicted
+            if len(outpoints) != len(tx.tx_ins) or not new_outputs(
+                    tx, ChainMap(self._creates, self.bank.utxo)):
+                self._counters['rejected'] += 1
+                return False
+            try:
+                self.bank.validate(tx, utxo=self._view)
+            except (AssertionError, BadSignatureError, TypeError,
+                    struct.error, ValueError):
+                # struct.error and ValueError from encoding invalid amounts
+                # or keys for the spend message
+                self._counters['rejected'] += 1
+                return False
+
+            self._txs[tx.id] = tx
+            self._accepted_at[tx.id] = time.monotonic()
+            self._children[tx.id] = set()
+            for tx_in in tx.tx_ins:
+                self._spends[tx_in.outpoint] = tx.id
+                if tx_in.tx_id in self._txs:
+                    self._children[tx_in.tx_id].add(tx.id)
+            for tx_out in tx.tx_outs:
+                self._creates[tx_out.outpoint] = tx_out
+            self._counters['accepted'] += 1
+            return True
+
+    def due(self):
+        """ Tells whether the pool has reached the batch size
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        bool
+        """
+        return len(self._txs) >= self.batch_size
+
+    def commit(self):
+        """ Commits all pending transactions to the bank in arrival order.
+        The caller has to make sure that nobody else reads or updates the
+        bank meanwhile
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        int
+            The number of committed transactions
+        """
+        with self._lock:
+            start = time.perf_counter()
+            now = time.monotonic()
+            committed = 0
+            for tx_id in list(self._txs):
+                tx = self._txs.get(tx_id)
+                if tx is None:
+                    # evicted as a descendant of an invalid transaction
+                    continue
+                # the pending parents are committed already, so every input
+                # has to be in the UTXO database now. Checked up front since
+                # update_utxo does not roll back a partially applied tx
+                outpoints = {tx_in.outpoint for tx_in in tx.tx_ins}
+                if len(outpoints) != len(tx.tx_ins) or \
+                   any(outpoint not in self.bank.utxo
+                       for outpoint in outpoints) or \
+                   not new_outputs(tx, self.bank.utxo):
+                    self.evict(tx_id)
+                    continue
+                self.bank.update_utxo(tx)
+                latency = now - self._accepted_at[tx_id]
+                self._latency_sum += latency
+                self._latency_max = max(self._latency_max, latency)
+                self._remove(tx)
+                committed += 1
+
+            if committed:
+                self._counters['committed'] += committed
+                self._counters['batches'] += 1
+                self._last_batch_size = committed
+                self._last_commit_seconds = time.perf_counter() - start
+            return committed
+
+    def evict(self, tx_id):
+        """ Removes a pending transaction and all pending transactions
+        spending from it, directly or indirectly
+
+        Parameters
+        ----------
+        tx_id: uuid.UUID
+            The ID of a pending transaction
+
+        Returns
+        -------
+        int
+            The number of evicted transactions
+        """
+        with self._lock:
+            evicted = 0
+            stack = [tx_id]
+            while stack:
+                tx = self._txs.get(stack.pop())
+                if tx is None:
+                    continue
+                stack.extend(self._children[tx.id])
+                self._remove(tx)
+                evicted += 1
+            self._counters['evicted'] += evicted
+            return evicted
+
+    def _remove(self, tx):
+        del self._txs[tx.id]
+        del self._accepted_at[tx.id]
+        del self._children[tx.id]
+        for tx_in in tx.tx_ins:
+            self._spends.pop(tx_in.outpoint, None)
+            parent = self._children.get(tx_in.tx_id)
+            if parent is not None:
+                parent.discard(tx.id)
+        for tx_out in tx.tx_outs:
+            del self._creates[tx_out.outpoint]
+
+    def metrics(self):
+        """ Size, eviction and commit latency figures of the pool
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The current and maximal size, counters of accepted, rejected,
+            conflicting, evicted and committed transactions, the number of
+            batches, the size and duration of the last batch and the
+            average and maximal seconds from acceptance to commit
+        """
+        with self._lock:
+            committed = self._counters['committed']
+            return dict(
+                self._counters,
+                size=len(self._txs),
+                max_size=self.max_size,
+                last_batch_size=self._last_batch_size,
+                last_commit_seconds=self._last_commit_seconds,
+                commit_latency_avg=(self._latency_sum / committed
+                                    if committed else 0.0),
+                commit_latency_max=self._latency_max,
+            )
+
+    def start(self, lock):
+        """ Commits periodically in a background thread
+
+        Parameters
+        ----------
+        lock: threading.Lock
+            The lock held by everybody accessing the bank, it is held
+            during a commit
+
+        Returns
+        -------
+        None
+        """
+        def run():
+            while not self._stop.wait(self.interval):
+                with lock:
+                    self.commit()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the background thread
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,310 @@
+""" A snapshot format of the UTXO database that can be memory-mapped and
+queried without loading it. Lets a node answer requests right after start-up
+and materialize TxOut objects only when they are used.
+
+The file consists of
+    * a header: magic, version, generation, number of keys and of records
+    * the key table sorted by key: raw public key (64 bytes), balance,
+      position of the owner's first entry in the owner table and count
+    * the records sorted by outpoint: transaction ID (16 bytes), index,
+      amount and the position of the owner key in the key table
+    * the owner table: positions of records grouped by owner key
+All integers are unsigned big-endian.
+
+For teaching purposes only.
+
+Contains the following classes:
+    * Snapshot
+    * SnapshotUTXO
+
+Contains the following functions:
+    * write_snapshot
+"""
+import mmap
+import struct
+from uuid import UUID
+from collections.abc import MutableMapping
+from ecdsa import VerifyingKey, SECP256k1
+
+# Constants
+MAGIC = b'OWNS'
+VERSION = 1
+HEADER = struct.Struct(">4sB3xQQQ")  # magic, version, generation, keys, recs
+KEY = struct.Struct(">64sQII")  # key, balance, first, count
+RECORD = struct.Struct(">16sIQI")  # tx_id, index, amount, key id
+OWNER = struct.Struct(">I")  # record id
+OUTPOINT_SIZE = 20  # the sort key of a record: tx_id and index
+
+
+def write_snapshot(path, generation, tx_outs):
+    """ Writes transaction outputs to a snapshot file
+
+    Parameters
+    ----------
+    path: str
+        The file to write
+    generation: int
+        The generation of the snapshot, see ownchain.journal
+    tx_outs: iterable
+        Transaction outputs of type TxOut with integer amounts
+
+    Returns
+    -------
+    None
+    """
+    records = sorted((tx_out.tx_id.bytes, tx_out.index, tx_out.amount,
+                      tx_out.public_key.to_string()) for tx_out in tx_outs)
+    keys = sorted({record[3] for record in records})
+    key_ids = {key: i for i, key in enumerate(keys)}
+
+    # group the records by owner
+    owned = [[] for _ in keys]
+    for record_id, record in enumerate(records):
+        owned[key_ids[record[3]]].append(record_id)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, generation, len(keys),
+                            len(records)))
+        first = 0
+        for key, record_ids in zip(keys, owned):
+            balance = sum(records[record_id][2] for record_id in record_ids)
+            f.write(KEY.pack(key, balance, first, len(record_ids)))
+            first += len(record_ids)
+        for tx_id, index, amount, key in records:
+            f.write(RECORD.pack(tx_id, index, amount, key_ids[key]))
+        for record_ids in owned:
+            for record_id in record_ids:
+                f.write(OWNER.pack(record_id))
+
+
+class Snapshot:
+    """ A memory-mapped snapshot written by write_snapshot. Lookups are
+    binary searches on the mapped file
+
+    Attributes
+    ----------
+    generation: int
+        The generation of the snapshot
+
+    Methods
+    -------
+    get
+        Looks up the output of an outpoint
+    owner
+        Looks up the balance and outpoints of a public key
+    keys
+        Iterates the raw public keys of all owners
+    close
+        Unmaps the file
+    """
+    def __init__(self, path, tx_out_cls):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.generation, self._num_keys, self._num_records = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown snapshot format or version")
+        self._tx_out_cls = tx_out_cls
+        self._keys_offset = HEADER.size
+        self._records_offset = self._keys_offset + self._num_keys * KEY.size
+        self._owners_offset = self._records_offset + \
+            self._num_records * RECORD.size
+        # mapping key id --> VerifyingKey
+        self._public_keys = {}
+
+    def __len__(self):
+        return self._num_records
+
+    def __iter__(self):
+        for record_id in range(self._num_records):
+            yield self._tx_out(record_id)
+
+    def _record_outpoint(self, record_id):
+        offset = self._records_offset + record_id * RECORD.size
+        return self._map[offset:offset + OUTPOINT_SIZE]
+
+    def _find_record(self, outpoint):
+        tx_id, index = outpoint
+        target = tx_id.bytes + struct.pack(">I", index)
+        low, high = 0, self._num_records
+        while low < high:
+            middle = (low + high) // 2
+            if self._record_outpoint(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._num_records and self._record_outpoint(low) == target:
+            return low
+        return None
+
+    def _public_key(self, key_id):
+        public_key = self._public_keys.get(key_id)
+        if public_key is None:
+            raw = KEY.unpack_from(self._map,
+                                  self._keys_offset + key_id * KEY.size)[0]
+            public_key = VerifyingKey.from_string(raw, curve=SECP256k1)
+            self._public_keys[key_id] = public_key
+        return public_key
+
+    def _tx_out(self, record_id):
+        tx_id, index, amount, key_id = RECORD.unpack_from(
+            self._map, self._records_offset + record_id * RECORD.size)
+        return self._tx_out_cls(tx_id=UUID(bytes=tx_id), index=index,
+                                amount=amount,
+                                public_key=self._public_key(key_id))
+
+    def __contains__(self, outpoint):
+        return self._find_record(outpoint) is not None
+
+    def get(self, outpoint):
+        """ Looks up the output of an outpoint
+
+        Parameters
+        ----------
+        outpoint: tuple
+            A tuple of transaction ID and index
+
+        Returns
+        -------
+        TxOut or None
+            A newly constructed output. None if the outpoint is unknown
+        """
+        record_id = self._find_record(outpoint)
+        if record_id is None:
+            return None
+        return self._tx_out(record_id)
+
+    def owner(self, public_key_bytes):
+        """ Looks up the balance and the outpoints of a public key
+
+        Parameters
+        ----------
+        public_key_bytes: bytes
+            The raw public key as returned by VerifyingKey.to_string()
+
+        Returns
+        -------
+        tuple
+            The balance and the list of outpoints. (0, []) if the key owns
+            nothing in the snapshot
+        """
+        low, high = 0, self._num_keys
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._keys_offset + middle * KEY.size
+            if self._map[offset:offset + 64] < public_key_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._num_keys:
+            return 0, []
+        key, balance, first, count = KEY.unpack_from(
+            self._map, self._keys_offset + low * KEY.size)
+        if key != public_key_bytes:
+            return 0, []
+
+        outpoints = []
+        for i in range(first, first + count):
+            (record_id,) = OWNER.unpack_from(self._map,
+                                             self._owners_offset + i * 4)
+            tx_id, index, _, _ = RECORD.unpack_from(
+                self._map, self._records_offset + record_id * RECORD.size)
+            outpoints.append((UUID(bytes=tx_id), index))
+        return balance, outpoints
+
+    def keys(self):
+        """ Iterates the raw public keys of all owners
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        generator of bytes
+        """
+        for key_id in range(self._num_keys):
+            yield KEY.unpack_from(self._map,
+                                  self._keys_offset + key_id * KEY.size)[0]
+
+    def close(self):
+        """ Unmaps the file
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        self._map.close()
+
+
+class SnapshotUTXO(MutableMapping):
+    """ A UTXO database backed by a snapshot. Outputs of the snapshot are
+    materialized on first use, new outputs are kept in a dict and spent
+    snapshot outputs are remembered in a set
+
+    Attributes
+    ----------
+    snapshot: Snapshot
+        The snapshot the database starts from
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # mapping (tx_id, index) --> tx_out, for outputs created since
+        self._added = {}
+        # mapping (tx_id, index) --> tx_out, for materialized outputs
+        self._loaded = {}
+        # spent outpoints of the snapshot
+        self._spent = set()
+
+    def __getitem__(self, outpoint):
+        tx_out = self._added.get(outpoint)
+        if tx_out is not None:
+            return tx_out
+        tx_out = self._loaded.get(outpoint)
+        if tx_out is not None:
+            return tx_out
+        if outpoint not in self._spent:
+            tx_out = self.snapshot.get(outpoint)
+            if tx_out is not None:
+                self._loaded[outpoint] = tx_out
+                return tx_out
+        raise KeyError(outpoint)
+
+    def __contains__(self, outpoint):
+        return outpoint in self._added or outpoint in self._loaded or \
+            (outpoint not in self._spent and outpoint in self.snapshot)
+
+    def __setitem__(self, outpoint, tx_out):
+        if outpoint in self._loaded or \
+           (outpoint not in self._spent and outpoint in self.snapshot):
+            raise ValueError(f"outpoint {outpoint} exists in the snapshot")
+        self._added[outpoint] = tx_out
+
+    def __delitem__(self, outpoint):
+        if outpoint in self._added:
+            del self._added[outpoint]
+        elif outpoint in self:
+            self._loaded.pop(outpoint, None)
+            self._spent.add(outpoint)
+        else:
+            raise KeyError(outpoint)
+
+    def __iter__(self):
+        for tx_out in self.snapshot:
+            if tx_out.outpoint not in self._spent:
+                yield tx_out.outpoint
+        yield from list(self._added)
+
+    def __len__(self):
+        return len(self.snapshot) - len(self._spent) + len(self._added)
+
+    def values(self):
+        # unlike the default, do not keep every output of the snapshot
+        for tx_out in self.snapshot:
+            if tx_out.outpoint not in self._spent:
+                yield self._loaded.get(tx_out.outpoint, tx_out)
+        yield from list(self._added.values())
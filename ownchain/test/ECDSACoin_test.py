@@ -0,0 +1,66 @@
+import pickle
+from ownchain import ECDSACoin
+from ownchain.ECDSACoin import User, Bank
+
+
+def test_checkpoint(monkeypatch):
+    """Repeated validation only verifies new transfers, a changed prefix
+    is verified again and fails
+    """
+    bank = Bank()
+    alice = User()
+    bob = User()
+    coin = bank.issue(alice.public_key)
+
+    for i in range(3):
+        sender, recipient = (alice, bob) if i % 2 == 0 else (bob, alice)
+        message = ECDSACoin.create_transfer_message(
+            coin.transfers[-1].signature, recipient.public_key)
+        coin.transfers.append(ECDSACoin.Transfer(
+            signature=sender.private_key.sign(message),
+            public_key=recipient.public_key))
+    assert coin.validate(bank)
+
+    messages = []
+    create_transfer_message = ECDSACoin.create_transfer_message
+    monkeypatch.setattr(ECDSACoin, 'create_transfer_message',
+                        lambda *args: messages.append(args) or
+                        create_transfer_message(*args))
+    assert coin.validate(bank)
+    assert messages == []
+
+    # the checkpoint is neither valid for another bank nor pickled
+    assert not coin.validate(Bank())
+    assert not hasattr(pickle.loads(pickle.dumps(coin)), '_checkpoint')
+
+    # Bob's transfer is replaced by a transfer to Mike
+    assert coin.validate(bank)
+    coin.transfers[2].public_key = User().public_key
+    assert not coin.validate(bank)
+    assert len(messages) > 1
+
+
+def test_parallel_validation(capsys):
+    """Chunked validation in worker processes reports the same first bad
+    transfer as the sequential validation
+    """
+    bank = Bank()
+    alice = User()
+    bob = User()
+    coin = bank.issue(alice.public_key)
+    for i in range(12):
+        sender, recipient = (alice, bob) if i % 2 == 0 else (bob, alice)
+        message = ECDSACoin.create_transfer_message(
+            coin.transfers[-1].signature, recipient.public_key)
+        coin.transfers.append(ECDSACoin.Transfer(
+            signature=sender.private_key.sign(message),
+            public_key=recipient.public_key))
+    assert coin.validate(bank, workers=2)
+
+    # break the signatures of transfers 5 and 9
+    for i in (5, 9):
+        coin.transfers[i].signature = coin.transfers[i + 1].signature
+    capsys.readouterr()
+    for workers in (None, 2):
+        assert not coin.validate(bank, workers=workers)
+        assert capsys.readouterr().out.split()[-1] == '6'
@@ -1,7 +1,11 @@
+import pickle
+import pytest
 from copy import deepcopy
+from ecdsa import BadSignatureError
 from ecdsa import SigningKey, SECP256k1
 from ownchain.bankcoin import Transfer, Bank
-from ownchain.utils import serialize
+from ownchain.utils import serialize, transfers_digest, \
+    LEGACY_MESSAGE_VERSION
 
 # Create accounts
 alice_private_key = SigningKey.generate(curve=SECP256k1)
@@ -45,3 +49,124 @@ def test_valid_transfers():
     assert bank.fetch_coins(alice_public_key) == [coin]
     assert bank.fetch_coins(bob_public_key) == []
     
+
+
+def test_incremental_observation():
+    """Only new transfers are verified and the bank keeps its own record
+    """
+    bank = Bank()
+    coin = bank.issue(alice_public_key)
+    coin.transfer(alice_private_key, bob_public_key)
+    bank.observe_coin(coin)
+
+    # a forged transfer to Alice signed by Alice instead of Bob
+    forged = deepcopy(coin)
+    forged.transfer(alice_private_key, alice_public_key)
+    with pytest.raises(BadSignatureError):
+        bank.observe_coin(forged)
+    assert bank.fetch_coins(bob_public_key) == [coin]
+
+    # a coin that does not continue the recorded transfers
+    stale = bank.issue(alice_public_key)
+    stale.id = coin.id
+    with pytest.raises(AssertionError):
+        bank.observe_coin(stale)
+
+    # later changes of the observed coin do not alter the record
+    coin.transfer(bob_private_key, alice_public_key)
+    coin.transfers[1].public_key = alice_public_key
+    assert bank.fetch_coins(bob_public_key) != []
+
+
+
+def test_owner_index():
+    """Coins move between owners in the index as transfers are observed
+    """
+    bank = Bank()
+    coins = [bank.issue(alice_public_key) for _ in range(3)]
+    coins[1].transfer(alice_private_key, bob_public_key)
+    bank.observe_coin(coins[1])
+
+    assert [coin.id for coin in bank.fetch_coins(alice_public_key)] == \
+        [coins[0].id, coins[2].id]
+    assert [coin.id for coin in bank.fetch_coins(bob_public_key)] == \
+        [coins[1].id]
+
+    coins[1].transfer(bob_private_key, alice_public_key)
+    bank.observe_coin(coins[1])
+    assert bank.fetch_coins(bob_public_key) == []
+    assert bob_public_key.to_string() not in bank.owners
+    assert len(bank.fetch_coins(alice_public_key)) == 3
+
+def test_checkpoint():
+    """Validation resumes from the verified prefix unless it changed
+    """
+    bank = Bank()
+    coin = bank.issue(alice_public_key)
+    coin.transfer(alice_private_key, bob_public_key)
+    coin.transfer(bob_private_key, alice_public_key)
+    coin.validate()
+    assert coin._checkpoint[0] == 3
+
+    coin.transfer(alice_private_key, bob_public_key)
+    coin.validate()
+    assert coin._checkpoint[0] == 4
+
+    # Alice's transfer to Bob is redirected to herself
+    coin.transfers[1].public_key = alice_public_key
+    with pytest.raises(BadSignatureError):
+        coin.validate()
+    assert coin._checkpoint is None
+
+
+def test_forged_checkpoint():
+    """The bank does not trust the checkpoint of an observed coin
+    """
+    mallory_public_key = SigningKey.generate(curve=SECP256k1) \
+        .get_verifying_key()
+    bank = Bank()
+    coin = bank.issue(alice_public_key)
+    coin.transfers.append(Transfer(signature=b'\x00' * 64,
+                                   public_key=mallory_public_key))
+    coin._checkpoint = (len(coin.transfers), transfers_digest(coin.transfers))
+    with pytest.raises(BadSignatureError):
+        bank.observe_coin(coin)
+    assert bank.fetch_coins(mallory_public_key) == []
+    assert len(bank.fetch_coins(alice_public_key)) == 1
+
+
+def test_legacy_messages():
+    """Coins signed under the legacy message format validate in the
+    compatibility mode only
+    """
+    bank = Bank()
+    coin = bank.issue(alice_public_key)
+    coin.message_version = LEGACY_MESSAGE_VERSION
+    coin.transfer(alice_private_key, bob_public_key)
+    coin.validate()
+
+    restored = pickle.loads(pickle.dumps(coin))
+    del restored.message_version
+    with pytest.raises(BadSignatureError):
+        restored.validate()
+    restored.message_version = LEGACY_MESSAGE_VERSION
+    restored.validate()
+
+
+def test_parallel_validation():
+    """Chunked validation in worker processes reports the first bad transfer
+    """
+    bank = Bank(workers=2)
+    coin = bank.issue(alice_public_key)
+    for i in range(10):
+        if i % 2 == 0:
+            coin.transfer(alice_private_key, bob_public_key)
+        else:
+            coin.transfer(bob_private_key, alice_public_key)
+    bank.observe_coin(coin)
+    assert bank.fetch_coins(alice_public_key) == [coin]
+
+    coin.transfers[7].signature = coin.transfers[3].signature
+    coin._checkpoint = None
+    with pytest.raises(BadSignatureError, match="number 7$"):
+        coin.validate(workers=2)
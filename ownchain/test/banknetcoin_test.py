@@ -2,7 +2,12 @@ import uuid
 import pytest
 from ecdsa import SigningKey, VerifyingKey, SECP256k1
 from ecdsa.keys import BadSignatureError
-from ownchain.banknetcoin import TxIn, TxOut, Tx, Bank
+from ownchain import banknetcoin
+from ownchain.banknetcoin import TxIn, TxOut, Tx, Bank, SIGNATURE_CACHE, \
+    encode_tx_out
+from ownchain.utils import SignatureCache
+from ownchain.utxostore import CompactUTXO
+from ownchain.test.helpers import make_tx
 
 # Create accounts
 alice_private_key = SigningKey.generate(curve=SECP256k1)
@@ -49,3 +54,319 @@ def test_public_key_comparisons():
 
     assert bob_public_key.to_string() == derived_bob_public_key.to_string()
     assert bob_public_key == derived_bob_public_key
+
+
+def test_owner_index():
+    """The owner index follows the UTXO set through issuance and spending
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    bank.issue(5, bob_public_key)
+
+    tx_ins = [
+        TxIn(tx_id=coinbase.id, index=0, signature=None)
+    ]
+    tx_id = uuid.uuid4()
+    tx_outs = [
+        TxOut(tx_id=tx_id, index=0, amount=10, public_key=bob_public_key),
+        TxOut(tx_id=tx_id, index=1, amount=990, public_key=bob_public_key)
+    ]
+    alice_to_bob = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    alice_to_bob.sign_input(0, alice_private_key)
+    bank.handle_tx(alice_to_bob)
+
+    assert bank.fetch_utxo(alice_public_key) == []
+    assert alice_public_key.to_string() not in bank.owners
+    assert [utxo.amount for utxo in bank.fetch_utxo(bob_public_key)] == \
+        [5, 10, 990]
+    assert 1005 == bank.fetch_balance(bob_public_key)
+    bank.check_balances()
+
+
+def test_balance_ledger():
+    """Running balances are kept in sync with the UTXO database
+    """
+    bank = Bank()
+    bank.issue(1000, alice_public_key)
+    bank.issue(500, alice_public_key)
+    assert 1500 == bank.fetch_balance(alice_public_key)
+    assert 0 == bank.fetch_balance(bob_public_key)
+    bank.check_balances()
+
+    # a ledger that drifted from the UTXO database is detected
+    bank.balances[alice_public_key.to_string()] += 1
+    with pytest.raises(AssertionError):
+        bank.check_balances()
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_outputs_must_be_new(batch):
+    """Outputs that would overwrite a UTXO or each other are rejected
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+
+    def rejected(tx):
+        if batch:
+            return bank.handle_txs([tx]) == [False]
+        with pytest.raises(AssertionError):
+            bank.handle_tx(tx)
+        return True
+
+    # Bob claims Alice's coin with an unsigned transaction without inputs
+    overwrite = Tx(id=coinbase.id, tx_ins=[], tx_outs=[
+        TxOut(tx_id=coinbase.id, index=0, amount=0,
+              public_key=bob_public_key)])
+    assert rejected(overwrite)
+    foreign = Tx(id=uuid.uuid4(), tx_ins=[], tx_outs=overwrite.tx_outs)
+    assert rejected(foreign)
+
+    # both outputs have the same outpoint
+    repeated = make_tx([(coinbase.id, 0)], [500, 500], alice_private_key,
+                       bob_public_key)
+    repeated.tx_outs[1].index = 0
+    repeated.sign_input(0, alice_private_key)
+    assert rejected(repeated)
+
+    assert [utxo.public_key for utxo in bank.fetch_utxo(alice_public_key)] \
+        == [alice_public_key]
+    assert 1000 == bank.fetch_balance(alice_public_key)
+    bank.check_balances()
+
+
+def test_duplicate_inputs():
+    """An output spent twice by one transaction is rejected and the
+    database is not changed
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    twice = make_tx([(coinbase.id, 0), (coinbase.id, 0)], [2000],
+                    alice_private_key, bob_public_key)
+    with pytest.raises(AssertionError):
+        bank.handle_tx(twice)
+    with pytest.raises(KeyError):
+        bank.update_utxo(twice)
+    assert list(bank.utxo) == [(coinbase.id, 0)]
+    assert 1000 == bank.fetch_balance(alice_public_key)
+    bank.check_balances()
+
+
+def test_utxo_pages():
+    """Pages of UTXOs are stable while UTXOs are spent and created
+    """
+    bank = Bank()
+    coinbases = [bank.issue(amount, alice_public_key)
+                 for amount in range(1, 8)]
+
+    utxos, cursor = bank.fetch_utxo_page(alice_public_key, limit=3)
+    assert [utxo.amount for utxo in utxos] == [1, 2, 3]
+
+    # spend the first UTXO of the next page and an already fetched one
+    tx_id = uuid.uuid4()
+    tx = Tx(id=tx_id,
+            tx_ins=[TxIn(tx_id=coinbases[3].id, index=0, signature=None),
+                    TxIn(tx_id=coinbases[0].id, index=0, signature=None)],
+            tx_outs=[TxOut(tx_id=tx_id, index=0, amount=5,
+                           public_key=alice_public_key)])
+    tx.sign_input(0, alice_private_key)
+    tx.sign_input(1, alice_private_key)
+    bank.handle_tx(tx)
+
+    amounts = []
+    while cursor is not None:
+        utxos, cursor = bank.fetch_utxo_page(alice_public_key, cursor, 3)
+        amounts += [utxo.amount for utxo in utxos]
+    assert amounts == [5, 6, 7, 5]
+    assert bank.fetch_utxo_page(bob_public_key) == ([], None)
+
+    # the page index of an owner is rebuilt once most UTXOs are spent
+    coinbases = [bank.issue(1, bob_public_key) for _ in range(40)]
+    bank.fetch_utxo_page(bob_public_key, limit=1)
+    bank.handle_tx(make_tx([(coinbase.id, 0) for coinbase in coinbases[:30]],
+                           [30], bob_private_key, bob_public_key))
+    assert bob_public_key.to_string() not in bank._pages
+    amounts, cursor = [], None
+    while True:
+        utxos, cursor = bank.fetch_utxo_page(bob_public_key, cursor, 4)
+        amounts += [utxo.amount for utxo in utxos]
+        if cursor is None:
+            break
+    assert amounts == [1] * 10 + [30]
+
+
+def test_utxo_covering():
+    """Only the UTXOs needed for an amount are returned
+    """
+    bank = Bank()
+    for amount in [1, 2, 50, 3, 40]:
+        bank.issue(amount, alice_public_key)
+
+    utxos = bank.fetch_utxo_covering(alice_public_key, 45)
+    assert sorted(utxo.amount for utxo in utxos) == [50]
+    utxos = bank.fetch_utxo_covering(alice_public_key, 42, 'bnb')
+    assert sorted(utxo.amount for utxo in utxos) == [2, 40]
+    assert bank.fetch_utxo_covering(alice_public_key, 97) == []
+
+def test_parallel_validation():
+    """Signatures checked in worker processes follow the same rules
+    """
+    bank = Bank(workers=2)
+    coinbases = [bank.issue(100, alice_public_key) for _ in range(4)]
+
+    tx_ins = [TxIn(tx_id=coinbase.id, index=0, signature=None)
+              for coinbase in coinbases]
+    tx_id = uuid.uuid4()
+    tx_outs = [
+        TxOut(tx_id=tx_id, index=0, amount=400, public_key=bob_public_key)
+    ]
+    alice_to_bob = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    for index in range(len(tx_ins)):
+        alice_to_bob.sign_input(index, alice_private_key)
+
+    # Bob signs one of the inputs himself
+    tx_ins[2].signature = bob_private_key.sign(b'bob wants it all')
+    with pytest.raises(BadSignatureError):
+        bank.handle_tx(alice_to_bob)
+
+    alice_to_bob.sign_input(2, alice_private_key)
+    bank.handle_tx(alice_to_bob)
+    assert 400 == bank.fetch_balance(bob_public_key)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_batch_handling(workers):
+    """A batch may chain spends, conflicting spends are rejected
+    """
+    bank = Bank(workers=workers)
+    coinbase = bank.issue(1000, alice_public_key)
+
+    # alice pays bob, bob spends the new output right away
+    alice_to_bob = make_tx([(coinbase.id, 0)], [1000], alice_private_key,
+                           bob_public_key)
+    bob_to_alice = make_tx([(alice_to_bob.id, 0)], [600, 400],
+                           bob_private_key, alice_public_key)
+    # alice tries to spend the coinbase a second time
+    double_spend = make_tx([(coinbase.id, 0)], [1000], alice_private_key,
+                           alice_public_key)
+    # bob spends an output of a rejected transaction
+    orphan = make_tx([(double_spend.id, 0)], [1000], bob_private_key,
+                     bob_public_key)
+    # bob spends alice's output
+    theft = make_tx([(bob_to_alice.id, 1)], [400], bob_private_key,
+                    bob_public_key)
+
+    txs = [alice_to_bob, bob_to_alice, double_spend, orphan, theft]
+    assert bank.validate_txs(txs) == [True, True, False, False, False]
+    assert 1000 == bank.fetch_balance(alice_public_key)
+
+    assert bank.handle_txs(txs) == [True, True, False, False, False]
+    assert 1000 == bank.fetch_balance(alice_public_key)
+    assert 0 == bank.fetch_balance(bob_public_key)
+    assert len(bank.utxo) == 2
+    bank.check_balances()
+
+    # outputs that cannot be encoded only reject their own transaction
+    coinbase = bank.issue(500, alice_public_key)
+    too_big = make_tx([(coinbase.id, 0)], [500, 0], alice_private_key,
+                      bob_public_key)
+    too_big.tx_outs[0].amount = 2**64
+    too_big.tx_outs[1].amount = 500 - 2**64
+    alice_to_bob = make_tx([(bob_to_alice.id, 1)], [400], alice_private_key,
+                           bob_public_key)
+    assert bank.validate_txs([too_big, alice_to_bob]) == [False, True]
+
+
+def test_signature_cache():
+    """Valid signatures are cached, invalid ones are never
+    """
+    SIGNATURE_CACHE.clear()
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    alice_to_bob = make_tx([(coinbase.id, 0)], [1000], alice_private_key,
+                           bob_public_key)
+
+    # dry run and real submission
+    bank.validate(alice_to_bob)
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (0, 1)
+    bank.handle_tx(alice_to_bob)
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (1, 1)
+
+    # a rejected signature is checked again on every attempt
+    bob_to_bob = make_tx([(alice_to_bob.id, 0)], [1000], alice_private_key,
+                         bob_public_key)
+    for _ in range(2):
+        with pytest.raises(BadSignatureError):
+            bank.validate(bob_to_bob)
+    assert (SIGNATURE_CACHE.hits, SIGNATURE_CACHE.misses) == (1, 3)
+    assert len(SIGNATURE_CACHE) == 1
+
+
+def test_signature_cache_eviction():
+    """The least recently used signature is dropped when the cache is full
+    """
+    cache = SignatureCache(maxsize=2)
+    keys = [cache.key(b'key', bytes([i]), b'message') for i in range(3)]
+    cache.add(keys[0])
+    cache.add(keys[1])
+    assert keys[0] in cache
+    cache.add(keys[2])
+
+    assert keys[1] not in cache
+    assert keys[0] in cache and keys[2] in cache
+    assert len(cache) == 2
+
+
+def test_outputs_digest(monkeypatch):
+    """The outputs are encoded once per validation and any change to them
+    after signing is detected
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    alice_to_bob = make_tx([(coinbase.id, 0)], [10, 990], alice_private_key,
+                           bob_public_key)
+    digest = alice_to_bob.outputs_digest
+
+    # two outputs spending three inputs
+    coins = [bank.issue(1, alice_public_key) for _ in range(3)]
+    tx = make_tx([(coin.id, 0) for coin in coins], [1, 2], alice_private_key,
+                 bob_public_key)
+    encoded = []
+    monkeypatch.setattr(banknetcoin, 'encode_tx_out',
+                        lambda tx_out: encoded.append(tx_out) or
+                        encode_tx_out(tx_out))
+    bank.validate(tx)
+    assert encoded == tx.tx_outs
+
+    # Bob swaps the outputs after Alice signed them
+    alice_to_bob.tx_outs = alice_to_bob.tx_outs[::-1]
+    assert digest != alice_to_bob.outputs_digest
+    with pytest.raises(BadSignatureError):
+        bank.handle_tx(alice_to_bob)
+
+    # Bob replaces the outputs by ones he built before Alice signed
+    alice_to_alice = make_tx([(coinbase.id, 0)], [10, 990],
+                             alice_private_key, alice_public_key)
+    tx_id = alice_to_alice.id
+    to_bob = TxOut(tx_id=tx_id, index=0, amount=990, public_key=bob_public_key)
+    to_alice = TxOut(tx_id=tx_id, index=1, amount=10,
+                     public_key=alice_public_key)
+    alice_to_alice.tx_outs[0] = to_bob
+    alice_to_alice.tx_outs[1] = to_alice
+    with pytest.raises(BadSignatureError):
+        bank.handle_tx(alice_to_alice)
+    assert bank.fetch_balance(bob_public_key) == 0
+
+
+def test_compact_utxo_store():
+    """The owner index and balances work on top of the compact store
+    """
+    bank = Bank(utxo=CompactUTXO(TxOut))
+    coinbase = bank.issue(1000, alice_public_key)
+    alice_to_bob = make_tx([(coinbase.id, 0)], [10, 990], alice_private_key,
+                           bob_public_key)
+    bank.handle_tx(alice_to_bob)
+
+    assert [utxo.amount for utxo in bank.fetch_utxo(bob_public_key)] == \
+        [10, 990]
+    assert 1000 == bank.fetch_balance(bob_public_key)
+    bank.check_balances()
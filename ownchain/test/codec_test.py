@@ -0,0 +1,65 @@
+import uuid
+import pickle
+import pytest
+from ecdsa import SigningKey, SECP256k1
+from ownchain import codec
+from ownchain.banknetcoin import prepare_message
+from ownchain.utils import serialize, deserialize
+from ownchain.test.helpers import signed_tx
+
+# Create accounts
+alice_private_key = SigningKey.generate(curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_private_key = SigningKey.generate(curve=SECP256k1)
+bob_public_key = bob_private_key.get_verifying_key()
+
+
+def make_tx():
+    """A signed transaction with multi-byte indices and amounts
+    """
+    return signed_tx([(uuid.uuid4(), 3), (uuid.uuid4(), 300)],
+                     [(10, bob_public_key), (2**40, alice_public_key)],
+                     alice_private_key)
+
+
+def test_tx_round_trip():
+    """A transaction survives encoding with its signatures intact
+    """
+    tx = make_tx()
+    serialized = serialize(prepare_message("tx", tx))
+    assert serialized.startswith(codec.MAGIC)
+
+    message = deserialize(serialized)
+    assert message["command"] == "tx"
+    decoded = message["data"]
+    assert decoded.id == tx.id
+    assert [tx_in.outpoint for tx_in in decoded.tx_ins] == \
+        [tx_in.outpoint for tx_in in tx.tx_ins]
+    assert [(tx_out.outpoint, tx_out.amount, tx_out.public_key)
+            for tx_out in decoded.tx_outs] == \
+        [(tx_out.outpoint, tx_out.amount, tx_out.public_key)
+         for tx_out in tx.tx_outs]
+    for index in range(len(tx.tx_ins)):
+        decoded.verify_input(index, alice_public_key)
+
+    # the compact format is much smaller than pickle
+    assert len(serialized) < len(pickle.dumps(prepare_message("tx", tx))) / 4
+
+
+def test_values_round_trip():
+    """Plain values and containers are encoded as well
+    """
+    values = [None, True, False, 0, -5, 2**70, "pong", b"\x00\xff",
+              (uuid.uuid4(), 1), [alice_public_key]]
+    assert codec.decode(codec.encode(values)) == values
+
+
+def test_fallback_to_pickle():
+    """Anything the codec does not know is pickled
+    """
+    message = {"previous_signature": b"", "next_public_key": bob_public_key}
+    assert serialize(message) == pickle.dumps(message)
+    assert deserialize(serialize(message)) == message
+
+    with pytest.raises(ValueError):
+        codec.decode(codec.encode(make_tx())[:-1])
@@ -0,0 +1,61 @@
+""" Transaction factories shared by the tests of banknetcoin, utxobankcoin,
+the mempool and the codec
+
+Contains the following functions:
+    * signed_tx
+    * make_tx
+    * transfer
+"""
+import uuid
+from ownchain import banknetcoin
+
+
+def signed_tx(outpoints, outputs, private_key, module=banknetcoin):
+    """Spends outpoints to outputs, every input signed with private_key
+
+    Parameters
+    ----------
+    outpoints: list
+        The (tx_id, index) pairs to spend
+    outputs: list
+        (amount, public_key) pairs, one per output
+    private_key: ecdsa.keys.SigningKey
+        The private key of the owner of the outpoints
+    module: module
+        banknetcoin or utxobankcoin, the module of Tx, TxIn and TxOut
+
+    Returns
+    -------
+    Tx
+    """
+    tx_id = uuid.uuid4()
+    tx_ins = [module.TxIn(tx_id=outpoint[0], index=outpoint[1],
+                          signature=None)
+              for outpoint in outpoints]
+    tx_outs = [module.TxOut(tx_id=tx_id, index=index, amount=amount,
+                            public_key=public_key)
+               for index, (amount, public_key) in enumerate(outputs)]
+    tx = module.Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    for index in range(len(tx_ins)):
+        tx.sign_input(index, private_key)
+    return tx
+
+
+def make_tx(outpoints, amounts, private_key, public_key, module=banknetcoin):
+    """Spends outpoints to public_key with one output per amount
+    """
+    return signed_tx(outpoints, [(amount, public_key) for amount in amounts],
+                     private_key, module)
+
+
+def transfer(tx_out, private_key, public_key, amount=None,
+             module=banknetcoin):
+    """Spends an output to public_key, the rest goes back to the sender.
+    None spends the whole output
+    """
+    amount = tx_out.amount if amount is None else amount
+    outputs = [(amount, public_key)]
+    if amount < tx_out.amount:
+        outputs.append((tx_out.amount - amount,
+                        private_key.get_verifying_key()))
+    return signed_tx([tx_out.outpoint], outputs, private_key, module)
@@ -0,0 +1,67 @@
+import os
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import Bank
+from ownchain.journal import Journal
+from ownchain.utils import prepare_tx
+
+# Create accounts
+alice_private_key = SigningKey.generate(curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_private_key = SigningKey.generate(curve=SECP256k1)
+bob_public_key = bob_private_key.get_verifying_key()
+
+
+def restart(directory, **kwargs):
+    bank = Bank()
+    Journal(directory, **kwargs).restore(bank)
+    return bank
+
+
+def pay(bank, amount):
+    tx = prepare_tx(bank.fetch_utxo(alice_public_key), alice_private_key,
+                    bob_public_key, amount)
+    bank.handle_tx(tx)
+
+
+def test_restart(tmp_path):
+    """The bank survives restarts with and without snapshots
+    """
+    bank = restart(tmp_path, snapshot_every=3)
+    bank.issue(1000, alice_public_key)
+    for _ in range(4):
+        pay(bank, 10)
+    bank.journal.close()
+
+    # one snapshot was written, the journal holds the last two txs
+    assert sorted(os.listdir(tmp_path)) == ["journal-1.log", "snapshot"]
+    assert bank.journal.generation == 1
+
+    restored = restart(tmp_path, snapshot_every=3)
+    assert restored.utxo.keys() == bank.utxo.keys()
+    assert 960 == restored.fetch_balance(alice_public_key)
+    assert 40 == restored.fetch_balance(bob_public_key)
+    restored.check_balances()
+
+    # the restored bank keeps recording
+    pay(restored, 60)
+    restored.journal.close()
+    assert 100 == restart(tmp_path).fetch_balance(bob_public_key)
+
+
+def test_torn_record(tmp_path):
+    """A partially written last record is dropped on restart
+    """
+    bank = restart(tmp_path)
+    bank.issue(1000, alice_public_key)
+    pay(bank, 10)
+    bank.journal.close()
+
+    path = tmp_path / "journal-0.log"
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial")
+
+    restored = restart(tmp_path)
+    assert 10 == restored.fetch_balance(bob_public_key)
+    restored.journal.close()
+    assert path.stat().st_size == size
@@ -0,0 +1,49 @@
+import pytest
+from ownchain import banknetcoin
+from ownchain.example_users import synthetic_users, user_public_key
+from ownchain.loadtest import parse_mix, percentile, run_loadtest
+
+
+def test_parse_mix():
+    """Mixes are parsed and invalid ones rejected
+    """
+    assert parse_mix("tx=1, balance=4") == {'tx': 1.0, 'balance': 4.0}
+    for mix in ["tx=1,mine=2", "tx=x", "tx=-1", "ping=0"]:
+        with pytest.raises(ValueError):
+            parse_mix(mix)
+
+
+def test_percentile():
+    """Nearest-rank percentiles
+    """
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+
+def test_synthetic_users():
+    """Synthetic users have distinct, deterministic keys
+    """
+    names = synthetic_users(3)
+    keys = {user_public_key(name).to_string() for name in names}
+    assert len(keys | {user_public_key('alice').to_string()}) == 4
+    assert user_public_key(names[0]) == user_public_key('user0')
+
+
+@pytest.mark.parametrize('mode', ['legacy', 'async'])
+def test_run_loadtest(mode):
+    """A short run accepts all requests and leaves BANK untouched
+    """
+    bank = banknetcoin.BANK
+    report = run_loadtest(users=4, clients=2, requests=10, mode=mode,
+                          mix=parse_mix("tx=1,balance=1,utxo=1,ping=1"))
+    assert banknetcoin.BANK is bank
+    assert report['requests'] == 20
+    assert report['rejected'] == 0
+    assert sum(operation['requests']
+               for operation in report['operations'].values()) == 20
+    assert report['latency_ms']['p50'] <= report['latency_ms']['p99']
+    with pytest.raises(AssertionError):
+        run_loadtest(users=2, clients=3, requests=1, mode=mode)
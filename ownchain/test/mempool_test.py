@@ -0,0 +1,112 @@
+import uuid
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import TxIn, TxOut, Tx, Bank
+from ownchain.mempool import Mempool
+from ownchain.test.helpers import transfer
+
+# Create accounts
+alice_private_key = SigningKey.generate(curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_private_key = SigningKey.generate(curve=SECP256k1)
+bob_public_key = bob_private_key.get_verifying_key()
+
+
+def test_chained_spends_and_conflicts():
+    """Pending outputs can be spent, pending spends cannot be repeated and
+    a batch commits in order
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    pool = Mempool(bank, batch_size=3)
+
+    alice_to_bob = transfer(coinbase.tx_outs[0], alice_private_key,
+                            bob_public_key, 10)
+    bob_to_alice = transfer(alice_to_bob.tx_outs[0], bob_private_key,
+                            alice_public_key)
+    double_spend = transfer(coinbase.tx_outs[0], alice_private_key,
+                            alice_public_key)
+    assert pool.add(alice_to_bob)
+    assert pool.add(bob_to_alice)
+    assert not pool.add(double_spend)
+    assert not pool.add(transfer(bob_to_alice.tx_outs[0], bob_private_key,
+                                 bob_public_key))
+    assert not pool.due()
+    assert bank.fetch_balance(bob_public_key) == 0
+
+    assert pool.commit() == 2
+    assert len(pool) == 0
+    assert bank.fetch_balance(alice_public_key) == 1000
+    bank.check_balances()
+
+    metrics = pool.metrics()
+    assert (metrics['accepted'], metrics['conflicts'], metrics['rejected'],
+            metrics['committed'], metrics['batches']) == (2, 1, 1, 2, 1)
+
+
+def test_eviction():
+    """Transactions whose inputs vanish are evicted with their descendants
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    pool = Mempool(bank, max_size=2)
+
+    alice_to_bob = transfer(coinbase.tx_outs[0], alice_private_key,
+                            bob_public_key)
+    bob_to_alice = transfer(alice_to_bob.tx_outs[0], bob_private_key,
+                            alice_public_key)
+    assert pool.add(alice_to_bob) and pool.add(bob_to_alice)
+    assert not pool.add(transfer(bank.issue(5, bob_public_key).tx_outs[0],
+                                 bob_private_key, alice_public_key))
+
+    # the coin is spent around the pool
+    bank.handle_tx(transfer(coinbase.tx_outs[0], alice_private_key,
+                            alice_public_key))
+    assert pool.commit() == 0
+    assert len(pool) == 0
+
+    metrics = pool.metrics()
+    assert (metrics['evicted'], metrics['rejected_full']) == (2, 1)
+
+
+def test_duplicate_inputs():
+    """An output listed twice as input is rejected, also at commit time
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    pool = Mempool(bank)
+
+    tx_id = uuid.uuid4()
+    tx_in = TxIn(tx_id=coinbase.id, index=0, signature=None)
+    twice = Tx(id=tx_id, tx_ins=[tx_in, tx_in],
+               tx_outs=[TxOut(tx_id=tx_id, index=0, amount=2000,
+                              public_key=bob_public_key)])
+    twice.sign_input(0, alice_private_key)
+    assert not pool.add(twice)
+    assert pool.metrics()['rejected'] == 1
+
+    # a pending transaction changed to spend its input twice is evicted
+    alice_to_bob = transfer(coinbase.tx_outs[0], alice_private_key,
+                            bob_public_key)
+    assert pool.add(alice_to_bob)
+    alice_to_bob.tx_ins.append(alice_to_bob.tx_ins[0])
+    assert pool.commit() == 0
+    assert len(pool) == 0 and pool.metrics()['evicted'] == 1
+    assert bank.fetch_balance(alice_public_key) == 1000
+    bank.check_balances()
+
+
+def test_outputs_must_be_new():
+    """Outputs must not replace a UTXO, even one spent by a pending
+    transaction
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    pool = Mempool(bank)
+    assert pool.add(transfer(coinbase.tx_outs[0], alice_private_key,
+                             bob_public_key))
+
+    overwrite = Tx(id=coinbase.id, tx_ins=[], tx_outs=[
+        TxOut(tx_id=coinbase.id, index=0, amount=0,
+              public_key=bob_public_key)])
+    assert not pool.add(overwrite)
+    assert pool.metrics()['rejected'] == 1
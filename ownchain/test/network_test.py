@@ -0,0 +1,192 @@
+import asyncio
+import socket
+import threading
+import pytest
+from ecdsa import SigningKey, SECP256k1
+from ownchain import banknetcoin
+from ownchain.banknetcoin import send_frame, recv_frame, send_message, \
+    MyTCPServer, TCPHandler, Bank, Client, start_async_server
+from ownchain.mempool import Mempool
+from ownchain.utils import prepare_tx
+
+# Create accounts
+alice_private_key = SigningKey.generate(curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_private_key = SigningKey.generate(curve=SECP256k1)
+bob_public_key = bob_private_key.get_verifying_key()
+
+
+@pytest.fixture(params=['legacy', 'async'])
+def server_address(request, monkeypatch):
+    """Runs a server with a fresh bank on a free port
+    """
+    monkeypatch.setattr(banknetcoin, 'BANK', Bank())
+    clients = {}
+    monkeypatch.setattr(banknetcoin, '_CLIENTS', clients)
+
+    if request.param == 'legacy':
+        server = MyTCPServer(('127.0.0.1', 0), TCPHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server.server_address
+        for client in clients.values():
+            client.close()
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    else:
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(
+            start_async_server(('127.0.0.1', 0), keepalive_timeout=1))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        yield server.sockets[0].getsockname()
+        for client in clients.values():
+            client.close()
+
+        async def shutdown():
+            server.close()
+            await server.wait_closed()
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_large_frames():
+    """Frames larger than a single recv arrive complete
+    """
+    payload = bytes(range(256)) * 20000
+    server, client = socket.socketpair()
+    with server, client:
+        sender = threading.Thread(target=send_frame, args=(client, payload))
+        sender.start()
+        assert recv_frame(server) == payload
+        sender.join()
+
+        # a clean close between frames is not an error
+        client.close()
+        assert recv_frame(server) is None
+
+
+def test_frame_limit():
+    """Frames above the configured maximum are refused
+    """
+    server, client = socket.socketpair()
+    with server, client:
+        send_frame(client, b"x" * 100)
+        with pytest.raises(ValueError):
+            recv_frame(server, max_frame_size=99)
+
+
+def test_server_commands(server_address):
+    """Both servers answer reads and apply transactions
+    """
+    banknetcoin.BANK.issue(1000, alice_public_key)
+
+    assert send_message('ping', '', server_address)['command'] == 'pong'
+    assert send_message('balance', alice_public_key,
+                        server_address)['data'] == 1000
+
+    utxos = send_message('utxo', alice_public_key, server_address)['data']
+    page, cursor = send_message('utxo-page', (alice_public_key, None, 10),
+                                server_address)['data']
+    assert [utxo.outpoint for utxo in page] == \
+        [utxo.outpoint for utxo in utxos] and cursor is None
+    utxos = send_message('utxo-covering', (alice_public_key, 10, 'largest'),
+                         server_address)['data']
+    tx = prepare_tx(utxos, alice_private_key, bob_public_key, 10)
+    assert send_message('tx', tx, server_address)['data'] == 'accepted'
+    assert send_message('tx', tx, server_address)['data'] == 'rejected'
+
+    assert send_message('balance', bob_public_key,
+                        server_address)['data'] == 10
+    assert send_message('nonsense', '', server_address)['command'] == 'error'
+
+
+
+def test_server_mempool(server_address, monkeypatch):
+    """With a mempool, transactions are committed once a batch is full and
+    chained spends of pending outputs are accepted
+    """
+    bank = banknetcoin.BANK
+    monkeypatch.setattr(banknetcoin, 'MEMPOOL', Mempool(bank, batch_size=2))
+    bank.issue(1000, alice_public_key)
+
+    utxos = send_message('utxo', alice_public_key, server_address)['data']
+    tx = prepare_tx(utxos, alice_private_key, bob_public_key, 10)
+    assert send_message('tx', tx, server_address)['data'] == 'accepted'
+    assert send_message('balance', bob_public_key,
+                        server_address)['data'] == 0
+
+    # spend the pending change
+    change = prepare_tx([tx.tx_outs[1]], alice_private_key, bob_public_key, 5)
+    assert send_message('txs', [tx, change], server_address)['data'] == \
+        ['rejected', 'accepted']
+    assert send_message('balance', bob_public_key,
+                        server_address)['data'] == 15
+
+    metrics = send_message('mempool', '', server_address)['data']
+    assert (metrics['size'], metrics['committed'], metrics['conflicts']) == \
+        (0, 2, 1)
+
+    # a transaction that cannot be encoded only rejects itself
+    coinbase = bank.issue(1000, alice_public_key)
+    utxos = send_message('utxo-covering', (alice_public_key, 1, 'first'),
+                         server_address)['data']
+    tx = prepare_tx(utxos, alice_private_key, bob_public_key, 1)
+    negative = prepare_tx(coinbase.tx_outs, alice_private_key, bob_public_key,
+                          10)
+    negative.tx_outs[0].amount = -10
+    negative.tx_outs[1].amount = 1010
+    assert send_message('txs', [tx, negative], server_address)['data'] == \
+        ['accepted', 'rejected']
+    banknetcoin.MEMPOOL.commit()
+    assert send_message('balance', bob_public_key,
+                        server_address)['data'] == 16
+
+def test_connection_reuse(server_address):
+    """A client sends many messages over one connection and reconnects
+    after the server dropped it
+    """
+    banknetcoin.BANK.issue(1000, alice_public_key)
+    with Client(server_address, pool_size=1) as client:
+        for _ in range(3):
+            assert client.send('balance', alice_public_key)['data'] == 1000
+        assert len(client._idle) == 1
+        sock = client._idle[0]
+
+        assert client.send('ping', '')['command'] == 'pong'
+        assert client._idle == [sock]
+
+        # the idle connection was closed by its peer in the meantime
+        stale, peer = socket.socketpair()
+        peer.close()
+        client._idle = [stale]
+        assert client.send('ping', '')['command'] == 'pong'
+        assert stale.fileno() == -1
+
+        # the peer stops answering after the message has been written, only
+        # reads are sent once more
+        def stale_connection():
+            stale, peer = socket.socketpair()
+            peer.shutdown(socket.SHUT_WR)
+            client._idle = [stale]
+            return peer
+
+        peer = stale_connection()
+        assert client.send('balance', alice_public_key)['data'] == 1000
+        peer.close()
+
+        tx = prepare_tx(banknetcoin.BANK.fetch_utxo(alice_public_key),
+                        alice_private_key, bob_public_key, 10)
+        peer = stale_connection()
+        with pytest.raises(ConnectionError):
+            client.send('tx', tx)
+        peer.close()
+        assert banknetcoin.BANK.fetch_balance(bob_public_key) == 0
@@ -0,0 +1,61 @@
+import uuid
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import Bank, TxOut
+from ownchain.snapshot import Snapshot, write_snapshot
+from ownchain.utils import prepare_tx
+
+# Create accounts
+alice_private_key = SigningKey.generate(curve=SECP256k1)
+alice_public_key = alice_private_key.get_verifying_key()
+bob_private_key = SigningKey.generate(curve=SECP256k1)
+bob_public_key = bob_private_key.get_verifying_key()
+
+
+def test_snapshot_lookups(tmp_path):
+    """Outputs and owners are found by binary search in the file
+    """
+    tx_outs = [TxOut(tx_id=uuid.uuid4(), index=i % 3, amount=i,
+                     public_key=alice_public_key if i % 2 else bob_public_key)
+               for i in range(50)]
+    path = tmp_path / "snapshot"
+    write_snapshot(path, 7, tx_outs)
+
+    snapshot = Snapshot(path, TxOut)
+    assert snapshot.generation == 7
+    assert len(snapshot) == 50
+    for tx_out in tx_outs:
+        found = snapshot.get(tx_out.outpoint)
+        assert (found.outpoint, found.amount) == \
+            (tx_out.outpoint, tx_out.amount)
+        assert found.public_key == tx_out.public_key
+    assert snapshot.get((uuid.uuid4(), 0)) is None
+
+    balance, outpoints = snapshot.owner(alice_public_key.to_string())
+    assert balance == sum(range(1, 50, 2))
+    assert sorted(outpoints) == sorted(tx_out.outpoint
+                                       for tx_out in tx_outs[1::2])
+    assert snapshot.owner(b"\x00" * 64) == (0, [])
+    snapshot.close()
+
+
+def test_bank_from_snapshot(tmp_path):
+    """A bank started from a snapshot loads owners when they are used
+    """
+    bank = Bank()
+    bank.issue(1000, alice_public_key)
+    bank.issue(500, bob_public_key)
+    path = tmp_path / "snapshot"
+    write_snapshot(path, 1, bank.utxo.values())
+
+    restored = Bank()
+    assert restored.load_snapshot(path) == 1
+    assert len(restored.utxo) == 2
+    assert restored.owners == {}
+
+    tx = prepare_tx(restored.fetch_utxo(alice_public_key), alice_private_key,
+                    bob_public_key, 10)
+    restored.handle_tx(tx)
+    assert 990 == restored.fetch_balance(alice_public_key)
+    assert 510 == restored.fetch_balance(bob_public_key)
+    assert len(restored.utxo) == 3
+    restored.check_balances()
@@ -1,4 +1,5 @@
 import uuid
+import pytest
 from ecdsa import SigningKey, SECP256k1
 from ownchain.txbankcoin import TxIn, TxOut, Tx, Bank
 
@@ -32,3 +33,30 @@ def test_bank_balances():
 
     assert 990 == bank.fetch_balance(alice_public_key)
     assert 10 == bank.fetch_balance(bob_public_key)
+
+
+def test_spent_and_owner_indexes():
+    """Spent outputs leave the owner index and cannot be spent again
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    bank.issue(5, bob_public_key)
+
+    tx_id = uuid.uuid4()
+    tx_ins = [TxIn(tx_id=coinbase.id, index=0, signature=None)]
+    tx_outs = [
+        TxOut(tx_id=tx_id, index=0, amount=1000, public_key=bob_public_key)
+    ]
+    alice_to_bob = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    alice_to_bob.sign_input(0, alice_private_key)
+    bank.handle_tx(alice_to_bob)
+
+    assert bank.spent == {(coinbase.id, 0)}
+    assert alice_public_key.to_string() not in bank.owners
+    assert bank.fetch_utxo(alice_public_key) == []
+    assert [tx_out.amount for tx_out in bank.fetch_utxo(bob_public_key)] == \
+        [5, 1000]
+
+    with pytest.raises(AssertionError):
+        bank.handle_tx(alice_to_bob)
+    assert 1005 == bank.fetch_balance(bob_public_key)
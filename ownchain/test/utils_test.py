@@ -0,0 +1,61 @@
+import uuid
+import pytest
+from ecdsa import SigningKey, SECP256k1
+from ownchain.banknetcoin import TxOut
+from ownchain.utils import select_utxos, encode_transfer_message, STRATEGIES
+
+public_key = SigningKey.generate(curve=SECP256k1).get_verifying_key()
+
+
+def wallet(*amounts):
+    return [TxOut(tx_id=uuid.uuid4(), index=0, amount=amount,
+                  public_key=public_key) for amount in amounts]
+
+
+def amounts(selection):
+    return sorted(tx_out.amount for tx_out in selection.utxos)
+
+
+def test_coin_selection():
+    """The strategies trade the number of inputs against the change
+    """
+    utxos = wallet(1, 2, 3, 5, 8, 12, 40, 50)
+
+    first = select_utxos(utxos, 15, 'first')
+    assert amounts(first) == [1, 2, 3, 5, 8]
+    assert first.change == 4
+
+    largest = select_utxos(utxos, 60, 'largest')
+    assert amounts(largest) == [40, 50]
+    assert largest.change == 30
+
+    min_inputs = select_utxos(utxos, 60, 'min_inputs')
+    assert amounts(min_inputs) == [12, 50]
+    assert (min_inputs.total, min_inputs.change) == (62, 2)
+
+    bnb = select_utxos(utxos, 45, 'bnb')
+    assert amounts(bnb) == [5, 40]
+    assert bnb.change == 0
+
+    # no exact match, fall back to min_inputs
+    fallback = select_utxos(wallet(10, 20, 30), 15, 'bnb')
+    assert amounts(fallback) == [20]
+    assert fallback.change == 5
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_insufficient_funds(strategy):
+    with pytest.raises(AssertionError):
+        select_utxos(wallet(1, 2), 4, strategy)
+
+
+def test_transfer_message_encoding():
+    """The canonical transfer message is deterministic and unambiguous
+    """
+    key = b'k' * 64
+    assert encode_transfer_message(b'sig', key) == \
+        b'OWNT\x01\x03sig\x40' + key
+    assert encode_transfer_message(None, key) == \
+        encode_transfer_message(b'', key)
+    assert encode_transfer_message(b'ab', b'c') != \
+        encode_transfer_message(b'a', b'bc')
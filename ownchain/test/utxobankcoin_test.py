@@ -1,6 +1,10 @@
 import uuid
+import pytest
 from ecdsa import SigningKey, SECP256k1
 from ownchain.utxobankcoin import TxIn, TxOut, Tx, Bank
+from ownchain import utxobankcoin
+from ownchain.utxostore import CompactUTXO
+from ownchain.test.helpers import transfer
 
 # Create accounts
 alice_private_key = SigningKey.generate(curve=SECP256k1)
@@ -32,3 +36,90 @@ def test_bank_balances():
 
     assert 990 == bank.fetch_balance(alice_public_key)
     assert 10 == bank.fetch_balance(bob_public_key)
+
+
+def test_compact_utxo_store():
+    """The compact store behaves like the default dict
+    """
+    bank = Bank(utxo=CompactUTXO(TxOut))
+    coinbase = bank.issue(1000, alice_public_key)
+
+    tx_ins = [
+        TxIn(tx_id=coinbase.id, index=0, signature=None)
+    ]
+    tx_id = uuid.uuid4()
+    tx_outs = [
+        TxOut(tx_id=tx_id, index=0, amount=10, public_key=bob_public_key),
+        TxOut(tx_id=tx_id, index=1, amount=990, public_key=alice_public_key)
+    ]
+
+    alice_to_bob = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    alice_to_bob.sign_input(0, alice_private_key)
+    bank.handle_tx(alice_to_bob)
+
+    assert 990 == bank.fetch_balance(alice_public_key)
+    assert 10 == bank.fetch_balance(bob_public_key)
+    assert coinbase.tx_outs[0].outpoint not in bank.utxo
+    assert sorted(bank.utxo) == sorted(tx_out.outpoint for tx_out in tx_outs)
+
+    # spent slots are reused
+    bank.update_utxo(Tx(id=uuid.uuid4(), tx_ins=[
+        TxIn(tx_id=tx_id, index=0, signature=None)], tx_outs=[]))
+    bank.issue(5, bob_public_key)
+    assert len(bank.utxo._amounts) == 2
+    assert 5 == bank.fetch_balance(bob_public_key)
+
+
+def test_undo_records():
+    """Applied transactions are reverted exactly, invalid sequences are not
+    applied at all and speculative validation leaves the database unchanged
+    """
+    bank = Bank()
+    coinbase = bank.issue(1000, alice_public_key)
+    before = dict(bank.utxo)
+
+    alice_to_bob = transfer(coinbase.tx_outs[0], alice_private_key,
+                            bob_public_key, module=utxobankcoin)
+    bob_to_alice = transfer(alice_to_bob.tx_outs[0], bob_private_key,
+                            alice_public_key, module=utxobankcoin)
+    undos = bank.apply_txs([alice_to_bob, bob_to_alice])
+    assert undos[0].spent == [coinbase.tx_outs[0]]
+    assert undos[1].created == [bob_to_alice.tx_outs[0].outpoint]
+    assert list(bank.utxo) == [bob_to_alice.tx_outs[0].outpoint]
+
+    bank.revert_txs(undos)
+    assert bank.utxo == before
+
+    # the second transaction spends the same output again
+    with pytest.raises(AssertionError):
+        bank.apply_txs([alice_to_bob, alice_to_bob])
+    assert bank.utxo == before
+
+    assert bank.validate_txs([alice_to_bob, alice_to_bob, bob_to_alice]) == \
+        [True, False, True]
+    assert bank.utxo == before
+
+    # a transaction spending its input twice is not applied partially
+    twice = transfer(coinbase.tx_outs[0], alice_private_key, bob_public_key,
+                     module=utxobankcoin)
+    twice.tx_ins.append(twice.tx_ins[0])
+    twice.tx_outs[0].amount = 2000
+    with pytest.raises(KeyError):
+        bank.update_utxo(twice)
+    assert bank.utxo == before
+    with pytest.raises(KeyError):
+        bank.apply_txs([twice])
+    assert bank.utxo == before
+    assert bank.validate_txs([twice, alice_to_bob]) == [False, True]
+    assert bank.utxo == before
+
+    # a transaction repeating an output is not applied at all
+    repeated = transfer(coinbase.tx_outs[0], alice_private_key,
+                        bob_public_key, module=utxobankcoin)
+    repeated.tx_outs.append(repeated.tx_outs[0])
+    repeated.tx_outs[0].amount = 500
+    with pytest.raises(AssertionError):
+        bank.update_utxo(repeated)
+    assert bank.utxo == before
+    assert bank.validate_txs([repeated, alice_to_bob]) == [False, True]
+    assert bank.utxo == before
@@ -21,6 +21,8 @@ Contains the following functions:
 ...
 """
 from uuid import uuid4
+from ecdsa import BadSignatureError
+from ownchain.utils import verify_signatures
 
 class Tx:
     """ A class that defines a transaction with inputs and outputs
@@ -136,9 +138,19 @@ class Bank:
     ----------
     txs: dict
         A database of transactions associated with an ID
+    spent: set
+        The (tx_id, index) pairs of all spent outputs
+    owners: dict
+        An index of the (tx_id, index) pairs of the unspent outputs
+        associated with the raw bytes of the public key of their owner
+    workers: int or None
+        The number of worker processes used to verify the signatures of
+        a transaction. None verifies them one at a time in this process
 
     Methods
     -------
+    update_indexes
+        Stores a transaction and updates the spent and owner indexes
     issue
         A method to issue new coins
     is_unspent
@@ -154,8 +166,42 @@ class Bank:
     fetch_balance
         Get the balance for a specific public_key
     """
-    def __init__(self):
+    def __init__(self, workers=None):
         self.txs = {}
+        self.workers = workers
+        # set of spent (tx_id, index) pairs
+        self.spent = set()
+        # mapping public_key.to_string() --> {(tx_id, index): None}
+        # a dict is used as an insertion ordered set
+        self.owners = {}
+
+    def update_indexes(self, tx):
+        """Stores a transaction and updates the spent and owner indexes
+
+        Parameters
+        ----------
+        tx: Tx
+            A valid transaction
+
+        Returns
+        -------
+        none
+        """
+        self.txs[tx.id] = tx
+
+        for tx_in in tx.tx_ins:
+            pair = (tx_in.tx_id, tx_in.index)
+            self.spent.add(pair)
+            tx_out = self.txs[tx_in.tx_id].tx_outs[tx_in.index]
+            owner = tx_out.public_key.to_string()
+            outputs = self.owners.get(owner, {})
+            outputs.pop(pair, None)
+            if not outputs:
+                self.owners.pop(owner, None)
+
+        for index, tx_out in enumerate(tx.tx_outs):
+            owner = tx_out.public_key.to_string()
+            self.owners.setdefault(owner, {})[(tx.id, index)] = None
 
     def issue(self, amount, public_key):
         """A method to issue new coins
@@ -178,7 +224,7 @@ class Bank:
             TxOut(tx_id=id, index=0, amount=amount, public_key=public_key)
         ]
         tx = Tx(id=id, tx_ins=tx_ins, tx_outs=tx_outs)
-        self.txs[tx.id] = tx
+        self.update_indexes(tx)
         return tx
 
     def is_unspent(self, tx_in):
@@ -193,18 +239,12 @@ class Bank:
         Returns
         -------
         bool
-            True if transaction input has already been spent. False otherwise.
+            False if transaction input has already been spent. True otherwise.
         """
 
-        # Check if the combination of index and id is already present in the
-        # transaction database
-        for tx in self.txs.values():
-            for input_tx in tx.tx_ins:
-                if input_tx.tx_id == tx_in.tx_id and \
-                   input_tx.index == tx_in.index:
-                    return False
-
-        return True
+        # Check if the combination of index and id has been spent by a
+        # transaction of the database
+        return (tx_in.tx_id, tx_in.index) not in self.spent
 
     def validate(self, tx):
         """Method to validate a transactions. That is, validate that the
@@ -223,6 +263,7 @@ class Bank:
         """
         in_sum = 0
         out_sum = 0
+        jobs = []
 
         for tx_in in tx.tx_ins:
             # check if unspent
@@ -232,11 +273,19 @@ class Bank:
             # from the associated outputs of a previous transaction
             tx_out = self.txs[tx_in.tx_id].tx_outs[tx_in.index]
             pub_key = tx_out.public_key
-            pub_key.verify(tx_in.signature, tx_in.spend_message())
+            if self.workers:
+                # defer the signature check to the process pool
+                jobs.append((pub_key.to_string(), tx_in.signature,
+                             tx_in.spend_message()))
+            else:
+                pub_key.verify(tx_in.signature, tx_in.spend_message())
 
             # sum up inputs
             in_sum += tx_out.amount
 
+        if jobs and not all(verify_signatures(jobs, self.workers)):
+            raise BadSignatureError("Invalid signature in transaction input")
+
         # sum up outputs
         for tx_out in tx.tx_outs:
             out_sum += tx_out.amount
@@ -257,7 +306,7 @@ class Bank:
         none
         """
         self.validate(tx)
-        self.txs[tx.id] = tx
+        self.update_indexes(tx)
 
     def fetch_utxo(self, public_key):
         """Get all unspent transactions (UTXOs) that are associated with a 
@@ -274,15 +323,9 @@ class Bank:
             All output transactions associated with the public_key, 
             but not in the spent list
         """
-        # Find which (tx_id, index) pairs have been spent
-        spent_pairs = [(tx_in.tx_id, tx_in.index)
-                       for tx in self.txs.values()
-                       for tx_in in tx.tx_ins]
-        # Return tx_outs associated with the public_key and not in the spent list
-        return [tx_out for tx in self.txs.values()
-                for i, tx_out in enumerate(tx.tx_outs)
-                    if public_key == tx_out.public_key
-                    and (tx.id, i) not in spent_pairs]
+        # Look up the unspent (tx_id, index) pairs of the owner
+        outputs = self.owners.get(public_key.to_string(), {})
+        return [self.txs[tx_id].tx_outs[index] for tx_id, index in outputs]
 
     def fetch_balance(self, public_key):
         """Get the balance for a specific public_key
@@ -5,14 +5,62 @@ Contains the following functions:
     * deserialize
     * to_disk
     * from_disk
+    * encode_varint
+    * decode_varint
+    * select_utxos
     * prepare_tx
+    * new_outputs
+    * encode_transfer_message
+    * transfers_digest
+    * get_pool
+    * verify_signature
+    * verify_signatures
+    * verify_signature_chunk
+    * first_invalid_signature
+
+Contains the following classes:
+    * Selection
+    * SignatureCache
 """
 
 import pickle
 import uuid
+import hashlib
+import bisect
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from ecdsa import BadSignatureError, VerifyingKey, SECP256k1
+
+# mapping number of workers --> ProcessPoolExecutor
+_POOLS = {}
+
+# coin selection strategies of select_utxos
+STRATEGIES = ('first', 'largest', 'bnb', 'min_inputs')
+BNB_MAX_TRIES = 100000
+
+# versions of the transfer messages signed by ECDSACoin and BankCoin
+LEGACY_MESSAGE_VERSION = 0  # serialized dict with the VerifyingKey object
+MESSAGE_VERSION = 1  # see encode_transfer_message
+TRANSFER_MESSAGE_MAGIC = b'OWNT'
+
+Selection = namedtuple('Selection', ['utxos', 'total', 'change'])
+Selection.__doc__ = """The UTXOs chosen by select_utxos
+
+Attributes
+----------
+utxos: list
+    The chosen UTXOs, one input each
+total: numeric
+    The sum of the chosen UTXOs
+change: numeric
+    The amount that goes back to the sender
+"""
 
 def serialize(coin):
-    """Turns Python object into bytecode
+    """Turns Python object into bytecode. Transactions, their inputs and
+    outputs and network messages of banknetcoin are written in the compact
+    binary format of ownchain.codec, everything else is pickled
 
     Parameters
     ----------
@@ -23,7 +71,13 @@ def serialize(coin):
     -------
     Bytecode
     """
-    return pickle.dumps(coin)
+    # some import to be corrected later
+    from ownchain import codec
+
+    try:
+        return codec.encode(coin)
+    except (TypeError, ValueError):
+        return pickle.dumps(coin)
 
 def deserialize(serialized):
     """Turns bytecode into a Python object
@@ -36,6 +90,11 @@ def deserialize(serialized):
     -------
     A python object
     """
+    # some import to be corrected later
+    from ownchain import codec
+
+    if serialized[:len(codec.MAGIC)] == codec.MAGIC:
+        return codec.decode(serialized)
     return pickle.loads(serialized)
 
 def to_disk(coin, filename):
@@ -72,7 +131,165 @@ def from_disk(filename):
         serialized = f.read()
     return deserialize(serialized)
 
-def prepare_tx(utxos, sender_private_key, receiver_public_key, amount):
+def encode_varint(value):
+    """Encodes a non-negative integer as unsigned LEB128 varint, that is
+    7 bits per byte with the high bit set on all but the last byte
+
+    Parameters
+    ----------
+    value: int
+        A non-negative integer
+
+    Returns
+    -------
+    bytes
+    """
+    if value < 0:
+        raise ValueError("varints cannot be negative")
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(data, offset=0):
+    """Decodes an unsigned LEB128 varint
+
+    Parameters
+    ----------
+    data: bytes
+        The encoded data
+    offset: int
+        The position of the varint in data
+
+    Returns
+    -------
+    tuple
+        The decoded integer and the offset of the first byte after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+def select_utxos(utxos, amount, strategy='first'):
+    """Chooses the UTXOs to spend for an amount
+
+    The strategies are
+        first: take the UTXOs in the given order until their sum exceeds
+            the amount
+        largest: take the largest UTXOs until their sum reaches the amount
+        min_inputs: use as few UTXOs as possible (as many as largest) and
+            among those prefer a small change
+        bnb: branch and bound search for UTXOs that sum up to exactly the
+            amount, so no change is needed. Falls back to min_inputs if there
+            is none or the search takes too long
+
+    Parameters
+    ----------
+    utxos: list of Tx_outs
+        A list of UTXOs that can be spend from
+    amount: numeric
+        The amount to be spent
+    strategy: str
+        One of STRATEGIES
+
+    Returns
+    -------
+    Selection
+        Raises AssertionError if the UTXOs do not cover the amount
+    """
+    assert strategy in STRATEGIES, f"unknown strategy {strategy}"
+
+    if strategy == 'first':
+        chosen = []
+        total = 0
+        for tx_out in utxos:
+            chosen.append(tx_out)
+            total += tx_out.amount
+            if total > amount:
+                break
+        assert total >= amount
+        return Selection(chosen, total, total - amount)
+
+    ordered = sorted(utxos, key=lambda tx_out: tx_out.amount, reverse=True)
+
+    if strategy == 'bnb':
+        chosen = _branch_and_bound(ordered, amount)
+        if chosen is not None:
+            return Selection(chosen, amount, 0)
+        strategy = 'min_inputs'
+
+    # largest first
+    chosen = []
+    total = 0
+    for tx_out in ordered:
+        if total >= amount:
+            break
+        chosen.append(tx_out)
+        total += tx_out.amount
+    assert total >= amount
+
+    if strategy == 'min_inputs' and chosen:
+        # keep all but the smallest chosen UTXO and replace it by the
+        # smallest UTXO that still covers the amount
+        rest = ordered[len(chosen) - 1:][::-1]
+        missing = amount - (total - chosen[-1].amount)
+        position = bisect.bisect_left([tx_out.amount for tx_out in rest],
+                                      missing)
+        total += rest[position].amount - chosen[-1].amount
+        chosen[-1] = rest[position]
+
+    return Selection(chosen, total, total - amount)
+
+def _branch_and_bound(ordered, amount):
+    """Depth first search for UTXOs summing up to exactly amount. The UTXOs
+    are sorted by decreasing amount and branches whose remaining UTXOs
+    cannot reach the amount are cut
+
+    Returns
+    -------
+    list or None
+        The UTXOs, None if nothing was found within BNB_MAX_TRIES steps
+    """
+    # remaining[i] is the sum of all UTXOs from i on
+    remaining = [0] * (len(ordered) + 1)
+    for i in range(len(ordered) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + ordered[i].amount
+
+    tries = 0
+    # picks[i] tells whether ordered[i] is part of the current branch
+    picks = []
+    stack = [(0, 0, False)]  # (index, sum so far, ordered[index - 1] picked)
+    while stack and tries < BNB_MAX_TRIES:
+        index, total, picked = stack.pop()
+        if index:
+            del picks[index - 1:]
+            picks.append(picked)
+        tries += 1
+
+        if total == amount:
+            return [tx_out for tx_out, pick in zip(ordered, picks) if pick]
+        if total > amount or index == len(ordered) or \
+           total + remaining[index] < amount:
+            continue
+
+        # explore including the next UTXO first, then leaving it out
+        stack.append((index + 1, total, False))
+        stack.append((index + 1, total + ordered[index].amount, True))
+
+    return None
+
+def prepare_tx(utxos, sender_private_key, receiver_public_key, amount,
+               strategy='first'):
     """Constructs transaction from given UTXOs of the sender and with new Tx
     outputs according to the given amount. Checks if sender has enough UTXOs
     to be spent.
@@ -87,6 +304,8 @@ def prepare_tx(utxos, sender_private_key, receiver_public_key, amount):
         The public_key of the receiver
     amount: numeric
         An amount to be spent from the UTXOs
+    strategy: str
+        The coin selection strategy, see select_utxos
 
     Returns
     -------
@@ -99,31 +318,340 @@ def prepare_tx(utxos, sender_private_key, receiver_public_key, amount):
     sender_public_key = sender_private_key.get_verifying_key()
     amount = int(amount)
 
-    # Construct TxIns
-    tx_ins = []
-    tx_in_sum = 0
-    for tx_outs in utxos:
-        tx_ins.append(TxIn(tx_id=tx_outs.tx_id, index=tx_outs.index,
-                           signature=None))
-        tx_in_sum += tx_outs.amount
-        if tx_in_sum > amount:
-            break
-
-    # Make sure sender can afford it
-    assert tx_in_sum >= amount
+    # Construct TxIns, makes sure sender can afford it
+    selection = select_utxos(utxos, amount, strategy)
+    tx_ins = [TxIn(tx_id=tx_out.tx_id, index=tx_out.index, signature=None)
+              for tx_out in selection.utxos]
 
-    # Construct TxOuts
+    # Construct TxOuts, without change if nothing is left
     tx_id = uuid.uuid4()
-    change = tx_in_sum - amount
     tx_outs = [
-        TxOut(tx_id=tx_id, index=0, amount=amount, public_key=receiver_public_key),
-        TxOut(tx_id=tx_id, index=1, amount=change, public_key=sender_public_key)
+        TxOut(tx_id=tx_id, index=0, amount=amount, public_key=receiver_public_key)
     ]
+    if selection.change:
+        tx_outs.append(TxOut(tx_id=tx_id, index=1, amount=selection.change,
+                             public_key=sender_public_key))
 
     # Construct Tx and sign input
     tx = Tx(id=tx_id, tx_ins=tx_ins, tx_outs=tx_outs)
+    outputs_digest = tx.outputs_digest
     for i in range(len(tx.tx_ins)):
-        tx.sign_input(i, sender_private_key)
+        tx.sign_input(i, sender_private_key, outputs_digest)
 
     return tx
 
+
+def new_outputs(tx, utxo):
+    """Tells whether the outputs of a transaction can be added to the UTXOs
+    without changing existing ones. That is, all outputs belong to the
+    transaction, their indices are distinct and none of their outpoints is
+    in the UTXOs already
+
+    Parameters
+    ----------
+    tx: banknetcoin.Tx or utxobankcoin.Tx
+        A transaction
+    utxo: mapping
+        The UTXOs the outputs would be added to
+
+    Returns
+    -------
+    bool
+    """
+    indices = set()
+    for tx_out in tx.tx_outs:
+        if tx_out.tx_id != tx.id or tx_out.index in indices or \
+           tx_out.outpoint in utxo:
+            return False
+        indices.add(tx_out.index)
+    return True
+
+
+def encode_transfer_message(previous_signature, public_key_bytes):
+    """Encodes the message of a coin transfer in the canonical format of
+    MESSAGE_VERSION: TRANSFER_MESSAGE_MAGIC, the version byte, then the
+    previous signature and the raw public key of the recipient, each
+    prefixed by its length as varint. A missing previous signature (None)
+    is encoded like an empty one
+
+    Parameters
+    ----------
+    previous_signature: bytes or None
+        The signature of the previous transfer
+    public_key_bytes: bytes
+        The raw public key as returned by VerifyingKey.to_string()
+
+    Returns
+    -------
+    bytes
+    """
+    previous_signature = previous_signature or b''
+    return b''.join((TRANSFER_MESSAGE_MAGIC, bytes([MESSAGE_VERSION]),
+                     encode_varint(len(previous_signature)),
+                     previous_signature,
+                     encode_varint(len(public_key_bytes)),
+                     public_key_bytes))
+
+
+def transfers_digest(transfers, digest=b''):
+    """Extends a hash chain over coin transfers. Any change of a signature
+    or public key of the transfers changes the digest
+
+    Parameters
+    ----------
+    transfers: iterable
+        Transfers with signature and public_key_bytes
+    digest: bytes
+        The digest of the transfers before them
+
+    Returns
+    -------
+    bytes
+    """
+    for transfer in transfers:
+        h = hashlib.sha256(digest)
+        h.update(b'' if transfer.signature is None else transfer.signature)
+        h.update(transfer.public_key_bytes)
+        digest = h.digest()
+    return digest
+
+
+def get_pool(workers):
+    """Returns a process pool with the given number of workers. Pools are
+    created on first use and shared, since starting worker processes is far
+    more expensive than a single signature check
+
+    Parameters
+    ----------
+    workers: int
+        The number of worker processes
+
+    Returns
+    -------
+    concurrent.futures.ProcessPoolExecutor
+    """
+    if workers not in _POOLS:
+        _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _POOLS[workers]
+
+def verify_signature(job):
+    """Verifies a single signature. Runs inside the worker processes of
+    verify_signatures
+
+    Parameters
+    ----------
+    job: tuple
+        A tuple of the raw bytes of a SECP256k1 public key (as returned by
+        VerifyingKey.to_string()), the signature and the signed message
+
+    Returns
+    -------
+    bool
+        True if the signature is valid. False otherwise
+    """
+    public_key_bytes, signature, message = job
+    public_key = VerifyingKey.from_string(public_key_bytes, curve=SECP256k1)
+    try:
+        return public_key.verify(signature, message)
+    except (BadSignatureError, TypeError):
+        # TypeError is raised for missing (None) signatures
+        return False
+
+def verify_signatures(jobs, workers, cache=None):
+    """Verifies a list of signatures in a pool of worker processes
+
+    Parameters
+    ----------
+    jobs: list
+        A list of (public key bytes, signature, message) tuples, see
+        verify_signature
+    workers: int
+        The number of worker processes
+    cache: SignatureCache or None
+        If given, signatures found in the cache are not verified again and
+        valid signatures are added to it
+
+    Returns
+    -------
+    list
+        A bool for each job in the order of jobs. True if the signature
+        is valid
+    """
+    results = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        if cache is not None and cache.key(*job) in cache:
+            results[i] = True
+        else:
+            pending.append(i)
+
+    chunksize = max(1, len(pending) // (4 * workers))
+    verified = get_pool(workers).map(verify_signature,
+                                     [jobs[i] for i in pending],
+                                     chunksize=chunksize)
+    for i, valid in zip(pending, verified):
+        results[i] = valid
+        if valid and cache is not None:
+            cache.add(cache.key(*jobs[i]))
+
+    return results
+
+
+def verify_signature_chunk(jobs):
+    """Verifies a chunk of signatures in order and stops at the first
+    invalid one. Runs inside the worker processes of first_invalid_signature
+
+    Parameters
+    ----------
+    jobs: list
+        A list of (public key bytes, signature, message) tuples, see
+        verify_signature
+
+    Returns
+    -------
+    int or None
+        The position of the first invalid signature in the chunk. None if
+        all are valid
+    """
+    for i, job in enumerate(jobs):
+        if not verify_signature(job):
+            return i
+    return None
+
+def first_invalid_signature(jobs, workers, chunk_size=None):
+    """Verifies an ordered list of signatures in chunks in a pool of
+    worker processes and finds the first invalid one. Chunks after a chunk
+    with an invalid signature are cancelled if they have not started yet
+
+    Parameters
+    ----------
+    jobs: list
+        A list of (public key bytes, signature, message) tuples, see
+        verify_signature
+    workers: int
+        The number of worker processes
+    chunk_size: int or None
+        The number of signatures per chunk. None makes four chunks per
+        worker
+
+    Returns
+    -------
+    int or None
+        The index of the first invalid signature in jobs. None if all are
+        valid
+    """
+    if not jobs:
+        return None
+    if chunk_size is None:
+        chunk_size = -(-len(jobs) // (4 * workers))
+
+    pool = get_pool(workers)
+    futures = [pool.submit(verify_signature_chunk, jobs[i:i + chunk_size])
+               for i in range(0, len(jobs), chunk_size)]
+    # all chunks before the first one with an invalid signature are valid
+    for n, future in enumerate(futures):
+        invalid = future.result()
+        if invalid is not None:
+            for later in futures[n + 1:]:
+                later.cancel()
+            return n * chunk_size + invalid
+    return None
+
+
+class SignatureCache:
+    """A bounded cache of signatures that have been verified as valid.
+    The least recently used entry is dropped once maxsize is reached.
+    Only valid signatures may be added, so a miss always means the
+    signature has to be verified
+
+    Attributes
+    ----------
+    maxsize: int
+        The maximal number of cached signatures
+    hits: int
+        The number of lookups that found a cached signature
+    misses: int
+        The number of lookups that did not find a cached signature
+
+    Methods
+    -------
+    key
+        Constructs the cache key of a signature
+    add
+        Records a valid signature
+    clear
+        Empties the cache and resets the counters
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    @staticmethod
+    def key(public_key_bytes, signature, message):
+        """Constructs the cache key of a signature
+
+        Parameters
+        ----------
+        public_key_bytes: bytes
+            The raw public key as returned by VerifyingKey.to_string()
+        signature: bytes
+            The signature
+        message: bytes
+            The signed message. Only its digest is kept
+
+        Returns
+        -------
+        tuple
+            A tuple of public key bytes, message digest and signature
+        """
+        return (public_key_bytes, hashlib.sha256(message).digest(), signature)
+
+    def add(self, key):
+        """Records a valid signature. Never call this before the signature
+        has been verified
+
+        Parameters
+        ----------
+        key: tuple
+            The key of the signature as constructed by key
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache and resets the counters
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
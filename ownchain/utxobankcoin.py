@@ -16,12 +16,16 @@ Contains the following classes:
     * Tx
     * TxIn
     * TxOut
+    * Undo
 
 Contains the following functions:
     * 
 ...
 """
 from uuid import uuid4
+from collections import namedtuple
+from ecdsa import BadSignatureError
+from ownchain.utils import new_outputs, verify_signatures
 
 class Tx:
     """ A class that defines a transaction with inputs and outputs
@@ -165,6 +169,10 @@ class TxOut:
         """
         return (self.tx_id, self.index)
 
+# The undo record of a transaction applied to the UTXO database: the removed
+# TxOuts of its inputs and the outpoints of its inserted outputs
+Undo = namedtuple('Undo', ['spent', 'created'])
+
 class Bank:
     """ The class of the bank, the central entity that keeps track of
     all transactions
@@ -172,27 +180,41 @@ class Bank:
     Attributes
     ----------
     utxo: dict
-        A database of unspent transactions associated with an ID and index
+        A database of unspent transactions associated with an ID and index.
+        An empty ownchain.utxostore.CompactUTXO may be passed instead of
+        the default dict to save memory
+    workers: int or None
+        The number of worker processes used to verify the signatures of
+        a transaction. None verifies them one at a time in this process
 
     Methods
     -------
     update_utxo
         Updates the UTXO database
+    revert_utxo
+        Reverts an update of the UTXO database
     issue
         A method to issue new coins
     validate
         Method to validate a transactions
     handle_tx
         Method to deal with incoming transactions
+    apply_txs
+        Validates and applies a sequence of transactions as a whole
+    revert_txs
+        Reverts a sequence of applied transactions
+    validate_txs
+        Speculatively validates an ordered batch of transactions
     fetch_utxo
         Get all unspent transactions (UTXOs) that are associated with a 
         specific public_key
     fetch_balance
         Get the balance for a specific public_key
     """
-    def __init__(self):
+    def __init__(self, workers=None, utxo=None):
         # mapping (tx_id, index) --> tx_out 
-        self.utxo = {}
+        self.utxo = {} if utxo is None else utxo
+        self.workers = workers
 
     def update_utxo(self, tx):
         """ Updates the UTXO database with new transaction outputs while
@@ -203,14 +225,51 @@ class Bank:
         tx: Tx
             A transaction
         
+        Returns
+        -------
+        Undo
+            The record to revert the update with revert_utxo. Raises
+            KeyError without changing the database if an input is not
+            unspent, e.g. because the transaction spends it twice, and
+            AssertionError if an output would overwrite a UTXO or another
+            output of the transaction, see utils.new_outputs
+        """
+        # every created outpoint is new, so revert_utxo can delete them
+        assert new_outputs(tx, self.utxo)
+
+        spent = []
+        try:
+            for tx_in in tx.tx_ins:
+                spent.append(self.utxo.pop(tx_in.outpoint))
+        except KeyError:
+            self.revert_utxo(Undo(spent, []))
+            raise
+
+        created = []
+        for tx_out in tx.tx_outs:
+            self.utxo[tx_out.outpoint] = tx_out
+            created.append(tx_out.outpoint)
+
+        return Undo(spent, created)
+
+    def revert_utxo(self, undo):
+        """ Reverts an update of the UTXO database. Only the outputs of
+        the record are touched. Updates have to be reverted in the reverse
+        order in which they were applied
+
+        Parameters
+        ----------
+        undo: Undo
+            The record returned by update_utxo
+
         Returns
         -------
         none
         """
-        for tx_in in tx.tx_ins:
-            del self.utxo[tx_in.outpoint]
+        for outpoint in reversed(undo.created):
+            del self.utxo[outpoint]
 
-        for tx_out in tx.tx_outs:
+        for tx_out in reversed(undo.spent):
             self.utxo[tx_out.outpoint] = tx_out
 
     def issue(self, amount, public_key):
@@ -254,6 +313,7 @@ class Bank:
         """
         in_sum = 0
         out_sum = 0
+        jobs = []
 
         for tx_in in tx.tx_ins:
             # check if unspent
@@ -263,11 +323,22 @@ class Bank:
             # from the associated outputs of a previous transaction
             tx_out = self.utxo[tx_in.outpoint]
             pub_key = tx_out.public_key
-            pub_key.verify(tx_in.signature, tx_in.spend_message)
+            if self.workers:
+                # defer the signature check to the process pool
+                jobs.append((pub_key.to_string(), tx_in.signature,
+                             tx_in.spend_message))
+            else:
+                pub_key.verify(tx_in.signature, tx_in.spend_message)
 
             # sum up inputs
             in_sum += tx_out.amount
 
+        if jobs and not all(verify_signatures(jobs, self.workers)):
+            raise BadSignatureError("Invalid signature in transaction input")
+
+        # outputs must not overwrite UTXOs
+        assert new_outputs(tx, self.utxo)
+
         # sum up outputs
         for tx_out in tx.tx_outs:
             out_sum += tx_out.amount
@@ -290,6 +361,80 @@ class Bank:
         self.validate(tx)
         self.update_utxo(tx)
 
+    def apply_txs(self, txs):
+        """Validates and applies a sequence of transactions, e.g. a block,
+        as a whole. A transaction may spend outputs of an earlier one. If
+        one of them is invalid, the ones applied before are reverted
+
+        Parameters
+        ----------
+        txs: list
+            Transactions of type Tx
+
+        Returns
+        -------
+        list
+            The undo records of the transactions in order. Pass them to
+            revert_txs to revert the whole sequence. Raises AssertionError,
+            BadSignatureError or KeyError if a transaction is invalid
+        """
+        undos = []
+        try:
+            for tx in txs:
+                self.validate(tx)
+                undos.append(self.update_utxo(tx))
+        except:
+            self.revert_txs(undos)
+            raise
+        return undos
+
+    def revert_txs(self, undos):
+        """Reverts a sequence of applied transactions in reverse order
+
+        Parameters
+        ----------
+        undos: list
+            The undo records as returned by apply_txs
+
+        Returns
+        -------
+        none
+        """
+        for undo in reversed(undos):
+            self.revert_utxo(undo)
+
+    def validate_txs(self, txs):
+        """Speculatively validates an ordered batch of transactions. Each
+        transaction is validated against the UTXO database updated by the
+        valid transactions before it. The database is left unchanged
+
+        Parameters
+        ----------
+        txs: list
+            Transactions of type Tx
+
+        Returns
+        -------
+        list
+            A bool per transaction, True if it is valid
+        """
+        undos = []
+        accepted = []
+        try:
+            for tx in txs:
+                try:
+                    self.validate(tx)
+                    # an input spent twice passes validate but not this
+                    undos.append(self.update_utxo(tx))
+                except (AssertionError, BadSignatureError, TypeError,
+                        KeyError):
+                    accepted.append(False)
+                    continue
+                accepted.append(True)
+        finally:
+            self.revert_txs(undos)
+        return accepted
+
     def fetch_utxo(self, public_key):
         """Get all unspent transactions (UTXOs) that are associated with a 
         specific public_key
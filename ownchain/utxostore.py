@@ -0,0 +1,106 @@
+""" A compact UTXO database for the Banks of utxoBankCoin and BankNetCoin.
+Instead of keeping a TxOut object with its own UUID and VerifyingKey per
+output, outpoints are packed into 20 bytes, amounts and owners are kept in
+typed arrays and every distinct public key is stored only once.
+
+For teaching purposes only.
+
+Contains the following classes:
+    * CompactUTXO
+"""
+import struct
+from array import array
+from uuid import UUID
+from collections.abc import MutableMapping
+
+# Constants
+OUTPOINT = struct.Struct(">16sI")  # tx_id, index
+
+
+class CompactUTXO(MutableMapping):
+    """ A mapping (tx_id, index) --> tx_out with the same behaviour as the
+    dict used by Bank.utxo, but a fraction of its memory. TxOut objects are
+    constructed when they are read
+
+    Attributes
+    ----------
+    tx_out_cls: type
+        The TxOut class of the bank using the store
+
+    Methods
+    -------
+    Those of a dict
+    """
+    def __init__(self, tx_out_cls):
+        self.tx_out_cls = tx_out_cls
+        # mapping packed outpoint --> slot in the arrays
+        self._slots = {}
+        self._amounts = array('Q')
+        self._owners = array('I')
+        self._free = []
+        # interned public keys and mapping raw key bytes --> owner id
+        self._keys = []
+        self._key_ids = {}
+
+    def _owner_id(self, public_key):
+        raw = public_key.to_string()
+        owner_id = self._key_ids.get(raw)
+        if owner_id is None:
+            owner_id = len(self._keys)
+            self._keys.append(public_key)
+            self._key_ids[raw] = owner_id
+        return owner_id
+
+    def _tx_out(self, packed, slot):
+        tx_id, index = OUTPOINT.unpack(packed)
+        return self.tx_out_cls(tx_id=UUID(bytes=tx_id), index=index,
+                               amount=self._amounts[slot],
+                               public_key=self._keys[self._owners[slot]])
+
+    def __getitem__(self, outpoint):
+        tx_id, index = outpoint
+        packed = OUTPOINT.pack(tx_id.bytes, index)
+        slot = self._slots.get(packed)
+        if slot is None:
+            raise KeyError(outpoint)
+        return self._tx_out(packed, slot)
+
+    def __contains__(self, outpoint):
+        tx_id, index = outpoint
+        return OUTPOINT.pack(tx_id.bytes, index) in self._slots
+
+    def __setitem__(self, outpoint, tx_out):
+        tx_id, index = outpoint
+        packed = OUTPOINT.pack(tx_id.bytes, index)
+        owner_id = self._owner_id(tx_out.public_key)
+        slot = self._slots.get(packed)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._amounts)
+                self._amounts.append(0)
+                self._owners.append(0)
+            self._slots[packed] = slot
+        self._amounts[slot] = tx_out.amount
+        self._owners[slot] = owner_id
+
+    def __delitem__(self, outpoint):
+        tx_id, index = outpoint
+        slot = self._slots.pop(OUTPOINT.pack(tx_id.bytes, index), None)
+        if slot is None:
+            raise KeyError(outpoint)
+        self._free.append(slot)
+
+    def __iter__(self):
+        for packed in self._slots:
+            tx_id, index = OUTPOINT.unpack(packed)
+            yield (UUID(bytes=tx_id), index)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def values(self):
+        # construct the outputs without looking up every outpoint again
+        for packed, slot in list(self._slots.items()):
+            yield self._tx_out(packed, slot)